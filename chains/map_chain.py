@@ -1,13 +1,20 @@
 from langchain_core.prompts import ChatPromptTemplate
 from llms.llm import LLM
 from langchain_core.output_parsers import StrOutputParser
-import os
 
-class MapChain(LLM):
+
+class MapChain:
     llm_id = "gpt-4o"
-    llm_obj = LLM(llm_id)
-    selected_llm = llm_obj.get_llm()
     map_prompt = ChatPromptTemplate.from_messages(
         [("system", "get relevant buttons links info etc with description:\\n\\n{context}")]
     )
-    map_chain = map_prompt | selected_llm | StrOutputParser()
+
+    # The model is resolved on first use rather than at import time. SDK retries are off:
+    # map/reduce calls go through llms.rate_limiter, which backs off on 429 instead
+    @classmethod
+    def selected_llm(cls):
+        return LLM(cls.llm_id, max_retries=0).get_llm()
+
+    @classmethod
+    def map_chain(cls):
+        return cls.map_prompt | cls.selected_llm() | StrOutputParser()
@@ -6,4 +6,7 @@ from chains.map_chain import MapChain
 
 class MapReduceChain(MapChain):
     reduce_prompt = ChatPromptTemplate([("human", reduce_template)])
-    reduce_chain = reduce_prompt | MapChain.selected_llm | StrOutputParser()
\ No newline at end of file
+
+    @classmethod
+    def reduce_chain(cls):
+        return cls.reduce_prompt | cls.selected_llm() | StrOutputParser()
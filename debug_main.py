@@ -1,8 +1,8 @@
 import os
 import pprint
-from bson import ObjectId
 from dotenv import load_dotenv
 from prompts.react import Prompt
+from persona.persona_store import persona_store
 from langchain.agents import create_react_agent, AgentExecutor
 import asyncio
 import logging
@@ -10,6 +10,7 @@ from llms.llm import LLM
 from utils.tools import crawl, query_site_visually, query_site_textually, get_links, analyze_heatmap, generate_python_code, \
     generate_feedback, run_python_code, check_for_feedback_reliability
 from utils.crawl_website import WebCrawler
+from utils.run_context import RunContext
 from urllib.parse import urlparse
 
 # Load environment variables
@@ -51,7 +52,7 @@ def verify_and_filter_domains(base_url, url_list):
 
 # Define main function
 async def main(url):
-    prompt = Prompt(os.getenv("mongo_db_uri"), ObjectId(os.getenv("persona")))
+    prompt = Prompt(persona_store.get(os.getenv("persona")))
     llm_id = os.getenv("llm_id")
     # os.environ["llm_id"] = "gpt-4o" # supports gpt-4o and sonnet-3-5 does not support gpt-o1
     # Import tools
@@ -66,10 +67,12 @@ async def main(url):
 
     # Execute asynchronously
     chunks = []
+    run_context = RunContext.create(os.getenv("persona"), llm_id, crawl_mode=os.getenv("crawl_mode"))
 
-    async for chunk in agent_executor.astream({"input": url}):
-        chunks.append(chunk)
-        pprint.pprint(chunk, depth=1)
+    with run_context.activate():
+        async for chunk in agent_executor.astream({"input": url}, run_context.config):
+            chunks.append(chunk)
+            pprint.pprint(chunk, depth=1)
 
     return chunks
 
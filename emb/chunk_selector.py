@@ -0,0 +1,91 @@
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+
+from utils.token_counter import count_tokens
+
+
+def persona_facets(persona_data: Dict[str, Any]) -> List[str]:
+    """What the persona looks for on a page: needs, barriers and expected features, one text each"""
+    nmb = persona_data.get("nmb", {})
+    facets = [f"Need: {need}" for need in nmb.get("needs", [])]
+    facets += [f"Barrier: {barrier}" for barrier in nmb.get("barriers", [])]
+    facets += [f"Expected feature: {feature}" for feature in persona_data.get("ux", {}).get("expectedFeatures", [])]
+    return facets
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+class ChunkSelector:
+    """Keeps the chunks most relevant to a persona within a chunk and token budget, in page order"""
+
+    _embeddings = None
+    _facet_vectors: "OrderedDict[str, np.ndarray]" = OrderedDict()
+    _lock = threading.Lock()
+
+    def __init__(self, persona_data: Dict[str, Any], persona_key: str, llm_id: str):
+        self.facets = persona_facets(persona_data)
+        self.persona_key = persona_key
+        self.llm_id = llm_id
+        self.logger = logging.getLogger(__name__)
+        self.last_scores: Optional[np.ndarray] = None
+
+    @classmethod
+    def embeddings(cls):
+        """Embeddings client shared by every selector, created on first use"""
+        with cls._lock:
+            if cls._embeddings is None:
+                from emb.embeddings import Embeddings
+                cls._embeddings = Embeddings()
+            return cls._embeddings
+
+    def facet_vectors(self) -> np.ndarray:
+        """Normalized persona facet embeddings, computed once per persona version"""
+        with self._lock:
+            vectors = self._facet_vectors.get(self.persona_key)
+        if vectors is None:
+            vectors = normalize_rows(self.embeddings().embed(self.facets))
+            with self._lock:
+                self._facet_vectors[self.persona_key] = vectors
+                while len(self._facet_vectors) > 64:
+                    self._facet_vectors.popitem(last=False)
+        return vectors
+
+    def score(self, chunks: List[Document]) -> np.ndarray:
+        """Cosine similarity of each chunk to the persona facet it matches best"""
+        chunk_vectors = normalize_rows(self.embeddings().embed([chunk.page_content for chunk in chunks]))
+        return (chunk_vectors @ self.facet_vectors().T).max(axis=1)
+
+    def select(self, chunks: List[Document], max_chunks: int, max_tokens: int) -> List[Document]:
+        """Top chunks by relevance until max_chunks or max_tokens is reached, falls back to the first chunks"""
+        tokens = [count_tokens(chunk.page_content, self.llm_id) for chunk in chunks]
+        if len(chunks) <= max_chunks and sum(tokens) <= max_tokens:
+            return chunks
+        if not self.facets:
+            return chunks[:max_chunks]
+        try:
+            scores = self.score(chunks)
+        except Exception as e:
+            self.logger.warning(f"Relevance scoring failed, keeping the first {max_chunks} chunks: {str(e)}")
+            return chunks[:max_chunks]
+        self.last_scores = scores
+
+        selected, used = [], 0
+        for position in np.argsort(-scores, kind="stable"):
+            if len(selected) == max_chunks:
+                break
+            if used + tokens[position] > max_tokens:
+                continue
+            selected.append(position)
+            used += tokens[position]
+        self.logger.info(f"Selected {len(selected)} of {len(chunks)} chunks ({used} tokens), "
+                         f"relevance {scores[selected].min():.3f}-{scores.max():.3f}" if selected else
+                         f"No chunk fits in {max_tokens} tokens")
+        return [chunks[position] for position in sorted(selected)]
@@ -1,6 +1,11 @@
 import os
+from typing import List
+
+import numpy as np
 from langchain_openai import AzureOpenAIEmbeddings
-from langchain_core.vectorstores import InMemoryVectorStore
+from langchain_core.documents import Document
+
+from emb.vector_index import get_vector_index
 
 
 class Embeddings:
@@ -8,14 +13,25 @@ class Embeddings:
         self.embeddings_model = AzureOpenAIEmbeddings(
             api_key=os.environ["azure_api_key_emb_1"],
             deployment=os.environ["azure_deployment_emb_1"],
-            azure_endpoint=os.environ["azure_endpoint_emb_1"]
+            azure_endpoint=os.environ["azure_endpoint_emb_1"],
+            # texts sent per embeddings request
+            chunk_size=int(os.getenv("emb_batch_size", 64))
         )
+        # Embeddings persist on disk per deployment, texts seen in earlier runs are never embedded again
+        self.index = get_vector_index(os.environ["azure_deployment_emb_1"])
+        self.rows = []
 
     def create_vector_store(self, chunks):
-        self.vectorstore = InMemoryVectorStore.from_texts(chunks, embedding=self.embeddings_model)
-        self.retriever = self.vectorstore.as_retriever()
+        self.rows = self.index.add_texts(chunks, self.embeddings_model.embed_documents)
 
-
-    def get_relevant_docs(self, query):
-        self.retrieved_documents = self.retriever.invoke(query)
+    def get_relevant_docs(self, query, k=4):
+        query_vector = self.embeddings_model.embed_query(query)
+        self.retrieved_documents = [
+            Document(self.index.text(row), metadata={"row": row, "score": score})
+            for row, score in self.index.search(query_vector, k, self.rows)
+        ]
         return self.retrieved_documents
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Normalized embeddings of texts, served from the index when known and otherwise requested in batches"""
+        return self.index.embed(texts, self.embeddings_model.embed_documents)
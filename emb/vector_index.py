@@ -0,0 +1,199 @@
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+DIGEST_SIZE = 32
+
+
+def text_hash(text: str) -> bytes:
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+class VectorIndex:
+    """Append-only on-disk vector index, read through memory maps so loading copies nothing.
+
+    Files in root, one row per text, all appended in the same order:
+        vectors.f32   row-normalized float32 embeddings
+        texts.bin     utf-8 texts back to back, offsets.u64 holds the end offset of each
+        hashes.bin    sha256 of each text, written last so a torn append is ignored on load
+    Several processes may share an index (API workers, CLI runs on the same tmp_folder): appends hold an
+    exclusive flock on append.lock and start from the rows actually on disk, rows added by other
+    processes are picked up before each lookup.
+    """
+
+    def __init__(self, root: str, batch_size: int = int(os.getenv("emb_batch_size", 64))):
+        self.root = root
+        self.batch_size = batch_size
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self.dim: Optional[int] = None
+        self.count = 0
+        self.rows: Dict[bytes, int] = {}
+        self.vectors: Optional[np.ndarray] = None
+        self.offsets: Optional[np.ndarray] = None
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(root, exist_ok=True)
+        self._load()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    @contextmanager
+    def _file_lock(self, operation: int = fcntl.LOCK_EX):
+        """Lock shared with the other processes using this index"""
+        with open(self._path("append.lock"), "a") as fp:
+            fcntl.flock(fp, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(fp, fcntl.LOCK_UN)
+
+    def _load(self):
+        with self._lock, self._file_lock(fcntl.LOCK_SH):
+            self._refresh()
+        self.logger.info(f"Loaded {self.count} vectors from {self.root}")
+
+    def _disk_count(self) -> int:
+        """Complete rows on disk, a torn append (hash not written yet) is not counted"""
+        sizes = [os.path.getsize(self._path(name)) if os.path.exists(self._path(name)) else 0
+                 for name in ("hashes.bin", "offsets.u64", "vectors.f32")]
+        return min(sizes[0] // DIGEST_SIZE, sizes[1] // 8, sizes[2] // (4 * self.dim))
+
+    def _refresh(self):
+        """Pick up rows other processes appended, caller holds the thread lock and a file lock"""
+        if self.dim is None:
+            try:
+                with open(self._path("meta.json")) as fp:
+                    self.dim = json.load(fp)["dim"]
+            except (OSError, ValueError, KeyError):
+                return
+        count = self._disk_count()
+        if count == self.count and self.vectors is not None:
+            return
+        if count < self.count:
+            # Files were replaced underneath us, start over from what is on disk
+            self.rows, self.count = {}, 0
+        if count > self.count:
+            hashes = np.memmap(self._path("hashes.bin"), dtype=f"S{DIGEST_SIZE}", mode="r", shape=(count,))
+            for row in range(self.count, count):
+                self.rows[bytes(hashes[row]).ljust(DIGEST_SIZE, b"\0")] = row
+        self.count = count
+        self._map()
+
+    def _map(self):
+        """(Re)map the files for the current row count, read-only views without copying"""
+        if not self.count:
+            self.vectors, self.offsets = np.zeros((0, self.dim or 0), dtype=np.float32), np.zeros(0, np.uint64)
+            return
+        self.vectors = np.memmap(self._path("vectors.f32"), dtype=np.float32, mode="r", shape=(self.count, self.dim))
+        self.offsets = np.memmap(self._path("offsets.u64"), dtype=np.uint64, mode="r", shape=(self.count,))
+
+    def _append(self, digests: List[bytes], texts: List[str], vectors: np.ndarray):
+        """Write one batch of rows, caller holds the thread lock and the exclusive file lock and has
+        refreshed, so self.count is the number of complete rows on disk"""
+        if self.dim is None:
+            self.dim = int(vectors.shape[1])
+            with open(self._path("meta.json"), "w") as fp:
+                json.dump({"dim": self.dim}, fp)
+        end = int(self.offsets[-1]) if self.count else 0
+        encoded = [text.encode("utf-8") for text in texts]
+        ends = end + np.cumsum([len(data) for data in encoded], dtype=np.uint64)
+
+        # Truncate any torn tail left by a crash so files stay aligned row for row
+        for name, row_size in (("vectors.f32", 4 * self.dim), ("offsets.u64", 8), ("hashes.bin", DIGEST_SIZE)):
+            if os.path.exists(self._path(name)):
+                os.truncate(self._path(name), self.count * row_size)
+        if os.path.exists(self._path("texts.bin")):
+            os.truncate(self._path("texts.bin"), end)
+
+        with open(self._path("vectors.f32"), "ab") as fp:
+            fp.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        with open(self._path("texts.bin"), "ab") as fp:
+            fp.write(b"".join(encoded))
+        with open(self._path("offsets.u64"), "ab") as fp:
+            fp.write(ends.astype(np.uint64).tobytes())
+        with open(self._path("hashes.bin"), "ab") as fp:
+            fp.write(b"".join(digests))
+        for digest in digests:
+            self.rows[digest] = self.count
+            self.count += 1
+        self._map()
+
+    def add_texts(self, texts: Sequence[str], embed: Callable[[List[str]], List[List[float]]]) -> List[int]:
+        """Row of each text, embedding only texts never seen before, in batches of batch_size"""
+        digests = [text_hash(text) for text in texts]
+        with self._lock, self._file_lock(fcntl.LOCK_SH):
+            self._refresh()
+            missing = {}
+            for digest, text in zip(digests, texts):
+                if digest not in self.rows:
+                    missing.setdefault(digest, text)
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+        pending = list(missing.items())
+        for start in range(0, len(pending), self.batch_size):
+            batch = pending[start:start + self.batch_size]
+            vectors = np.asarray(embed([text for _, text in batch]), dtype=np.float32)
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+            with self._lock, self._file_lock():
+                self._refresh()
+                fresh = [(digest, text, vector) for (digest, text), vector in zip(batch, vectors)
+                         if digest not in self.rows]
+                if fresh:
+                    self._append([d for d, _, _ in fresh], [t for _, t, _ in fresh], np.stack([v for _, _, v in fresh]))
+        return [self.rows[digest] for digest in digests]
+
+    def embed(self, texts: Sequence[str], embed: Callable[[List[str]], List[List[float]]]) -> np.ndarray:
+        """Normalized embeddings of texts, one row each, served from the index when already known"""
+        rows = self.add_texts(texts, embed)
+        return np.asarray(self.vectors[rows]) if rows else np.zeros((0, self.dim or 0), dtype=np.float32)
+
+    def text(self, row: int) -> str:
+        start = int(self.offsets[row - 1]) if row else 0
+        with open(self._path("texts.bin"), "rb") as fp:
+            fp.seek(start)
+            return fp.read(int(self.offsets[row]) - start).decode("utf-8")
+
+    def search(self, query: np.ndarray, k: int = 4, rows: Optional[Sequence[int]] = None) -> List[Tuple[int, float]]:
+        """Rows closest to query by cosine similarity, optionally restricted to a subset of rows"""
+        if not self.count:
+            return []
+        query = np.asarray(query, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        if rows is None:
+            candidates, scores = np.arange(self.count), self.vectors @ query
+        else:
+            candidates = np.unique(np.asarray(rows, dtype=np.int64))
+            scores = self.vectors[candidates] @ query
+        best = np.argsort(-scores, kind="stable")[:k]
+        return [(int(candidates[i]), float(scores[i])) for i in best]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"vectors": self.count, "dim": self.dim, "hits": self.hits, "misses": self.misses}
+
+
+_indexes: Dict[str, VectorIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_vector_index(name: str) -> VectorIndex:
+    """Process-wide index per embedding deployment, under tmp_folder/vector_index unless vector_index_dir is set"""
+    with _indexes_lock:
+        index = _indexes.get(name)
+        if index is None:
+            tmp_folder = os.getenv("tmp_folder") or os.path.join(os.getcwd(), "tmp_folder")
+            root = os.getenv("vector_index_dir") or os.path.join(tmp_folder, "vector_index")
+            index = _indexes[name] = VectorIndex(os.path.join(root, name))
+        return index
+
+
+def vector_index_stats() -> Dict[str, Any]:
+    return {name: index.stats() for name, index in _indexes.items()}
@@ -1,5 +1,6 @@
 # Imports standards
 import os
+import threading
 import cv2
 import numpy as np
 import tensorflow as tf
@@ -8,7 +9,6 @@ from datetime import datetime
 # Imports TensorFlow/Keras
 from tensorflow.keras.models import Model
 from tensorflow.keras.applications import ResNet50
-from tensorflow.keras.preprocessing.image import load_img, img_to_array
 from tensorflow.keras.applications.resnet50 import preprocess_input
 
 # EnhancedLongContextHandler
@@ -24,12 +24,22 @@ from utils.common_utils import beautify
 
 
 class HeatmapGenerator:
+    # ResNet50 is loaded once per process and shared by every generator
+    _model = None
+    _model_lock = threading.Lock()
+
     def __init__(self, persona_data: dict, lch: EnhancedLongContextHandler):
         self.persona = persona_data
-        self.model = self._initialize_model()
+        if HeatmapGenerator._model is None:
+            # Concurrent runs build their generators in worker threads, only one of them loads the weights
+            with HeatmapGenerator._model_lock:
+                if HeatmapGenerator._model is None:
+                    HeatmapGenerator._model = self._initialize_model()
+        self.model = HeatmapGenerator._model
         self.lch = lch
 
-    def _initialize_model(self):
+    @staticmethod
+    def _initialize_model():
         # Initialisation de ResNet50 sans les couches fully connected
         base_model = ResNet50(weights='imagenet', include_top=False)
 
@@ -42,10 +52,9 @@ class HeatmapGenerator:
             ]
         )
 
-    def generate(self, image_path: str):
-        # Chargement et prétraitement de l'image
-        image = load_img(image_path, target_size=(512, 512))
-        image_array = img_to_array(image)
+    def generate(self, image):
+        # Prétraitement de l'image (ImageArtifact), sans relecture du disque
+        image_array = image.rgb_array((512, 512)).astype("float32")
         image_array = np.expand_dims(image_array, axis=0)
         image_array = preprocess_input(image_array)
 
@@ -0,0 +1,72 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain.agents import create_react_agent, AgentExecutor
+
+from llms.llm import LLM
+from prompts.react import Prompt
+from persona.persona_store import PersonaBundle, persona_store
+
+
+class AgentExecutorCache:
+    """LRU cache of ready-to-run ReAct executors keyed by (llm_id, persona_id, tools, persona version)"""
+
+    def __init__(self, max_size: int = int(os.getenv("agent_cache_size", 32))):
+        self.max_size = max_size
+        self.logger = logging.getLogger(__name__)
+        self._executors: "OrderedDict[Tuple[str, str, Tuple[str, ...], str], AgentExecutor]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, llm_id: str, persona_id: str, tools: List[Any]) -> AgentExecutor:
+        """Return the cached executor for this model/persona/toolset, building it on a miss"""
+        bundle = persona_store.get(persona_id)
+        # The persona version is part of the key so an edited persona never serves a stale prompt
+        key = (llm_id, str(persona_id), tuple(t.name for t in tools), bundle.version)
+        with self._lock:
+            executor = self._executors.get(key)
+            if executor is not None:
+                self._executors.move_to_end(key)
+                self.hits += 1
+                return executor
+            self.misses += 1
+
+        executor = self._build(llm_id, bundle, tools)
+        with self._lock:
+            self._executors[key] = executor
+            self._executors.move_to_end(key)
+            while len(self._executors) > self.max_size:
+                self._executors.popitem(last=False)
+        return executor
+
+    def invalidate(self, llm_id: Optional[str] = None, persona_id: Optional[str] = None) -> int:
+        """Drop executors matching the given model and/or persona (all of them when both are None)"""
+        with self._lock:
+            stale = [key for key in self._executors
+                     if (llm_id is None or key[0] == llm_id) and (persona_id is None or key[1] == str(persona_id))]
+            for key in stale:
+                del self._executors[key]
+        self.logger.info(f"Invalidated {len(stale)} cached agent executors")
+        return len(stale)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": len(self._executors),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    @staticmethod
+    def _build(llm_id: str, bundle: PersonaBundle, tools: List[Any]) -> AgentExecutor:
+        prompt = Prompt(bundle)
+        llm = LLM(llm_id).get_llm()
+        react_agent = create_react_agent(tools=tools, llm=llm, prompt=prompt.create_prompt_template())
+        return AgentExecutor(agent=react_agent, tools=tools, handle_parsing_errors=True, verbose=True)
+
+
+agent_cache = AgentExecutorCache()
@@ -1,28 +1,22 @@
-from typing import Dict, Any, List, Literal
+from typing import Dict, Any, List, Optional, Tuple
 from dataclasses import dataclass
-from langchain_core.output_parsers import StrOutputParser
-from langchain.chains.combine_documents.reduce import (
-    acollapse_docs,
-    split_list_of_docs,
-)
-from langchain_core.documents import Document
-from langgraph.constants import Send
-from langgraph.graph import END, START, StateGraph
 from utils.helper_functions import HelperFunct
 import asyncio
 from datetime import datetime
 import logging
 import os
-from states.state import SummaryState, OverallState
-from chains.map_reduce_chain import MapReduceChain
-from handlers.PersonaContextProcessor import PersonaMapReduceChain
-from emb.embeddings import Embeddings
+from states.state import SummaryState
+from handlers.persona_graph import PersonaGraph
+from emb.chunk_selector import ChunkSelector
+from utils.token_counter import TokenBudget
+from handlers.streaming_map import StreamingMapper
+from utils.site_crawler import site_key
 
 
 @dataclass
 class AnalysisConfig:
     """Configuration for analysis parameters"""
-    token_max: int = 1000
+    token_max: Optional[int] = None  # derived from the map model's context window when unset
     chunk_count_limit: int = 10
     recursion_limit: int = 10
 
@@ -40,8 +34,10 @@ class AnalysisSection:
 class EnhancedLongContextHandler(HelperFunct):
     """Enhanced context handler for processing website content with persona context"""
 
-    def __init__(self, tmp_folder: str, prompt, beau):
-        """Initialize the enhanced context handler"""
+    def __init__(self, tmp_folder: str, prompt, beau, map_prompt=None, reduce_prompt=None,
+                 token_budget: Optional[TokenBudget] = None, persona_key: Optional[str] = None,
+                 graph: Optional[PersonaGraph] = None):
+        """Initialize the enhanced context handler, reusing the persona's compiled graph when given"""
         # Initialize parent
         super().__init__(tmp_folder)
 
@@ -55,35 +51,29 @@ class EnhancedLongContextHandler(HelperFunct):
         # Beautify
         self.beau = beau
 
-        # Store persona data
+        # Store persona data, persona_key scopes chunk summaries shared between pages of a site
         self.persona_data = self.prompt.persona
-        self.persona_chains = PersonaMapReduceChain(self.prompt.persona)
-
-        # Initialize base map-reduce chains
-        self.map_chain = MapReduceChain.map_chain
-        self.reduce_chain = MapReduceChain.reduce_chain
-
-        # Create persona-specific chains
-        self.persona_map_chain = (
-                self.persona_chains.create_persona_map_prompt() |
-                MapReduceChain.selected_llm |
-                StrOutputParser()
-        )
-
-        self.persona_reduce_chain = (
-                self.persona_chains.create_persona_reduce_prompt() |
-                MapReduceChain.selected_llm |
-                StrOutputParser()
-        )
-
-        # Initialize analysis parameters
+        self.persona_key = persona_key or str(self.persona_data.get("_id", self.persona_data.get("name")))
+        self.page_url: Optional[str] = None
+        # Pages of the same site run share mapped boilerplate, set by RunContext
+        self.site_run: Optional[str] = None
+
+        # Chains and the compiled graph are shared per persona, this handler only holds run state
+        self.graph = graph or PersonaGraph(prompt, map_prompt, reduce_prompt)
+
+        # Initialize analysis parameters, sized from real token counts of the map model
+        self.llm_id = self.graph.llm_id
+        self.token_budget = token_budget or TokenBudget()
         self.config = AnalysisConfig()
-        self.token_max = self.config.token_max
+        self.token_max = self.config.token_max or self.token_budget.collapse_threshold(self.llm_id)
+        self.chunk_size = self.token_budget.chunk_size(self.llm_id)
         self.chunk_count_limit = self.config.chunk_count_limit
+        self.chunk_selector = ChunkSelector(self.persona_data, self.persona_key, self.llm_id)
 
         # Initialize state
         self.summary = ""
         self.split_docs = []
+        self.stream: Optional[StreamingMapper] = None
         self.analysis_sections = {
             "visual": [],
             "textual": [],
@@ -97,16 +87,43 @@ class EnhancedLongContextHandler(HelperFunct):
         """Initialize scratchpad with error handling"""
         try:
             if not os.path.exists(self.agent_scratchpad_path):
-                self.write_file(self.agent_scratchpad_path, "")
-                self.logger.info(f"Created new scratchpad at {self.agent_scratchpad_path}")
+                self.logger.info(f"Creating new scratchpad at {self.agent_scratchpad_path}")
+            self.scratchpad
         except Exception as e:
             self.logger.error(f"Failed to initialize scratchpad: {str(e)}")
             raise
 
+    def chunk_limit(self) -> int:
+        """Number of chunks mapped per page, lowered when the run budget cannot afford them"""
+        limit = self.chunk_count_limit
+        affordable = self.token_budget.affordable_chunks(self.chunk_size)
+        if affordable is not None:
+            limit = min(limit, affordable)
+        return limit
+
+    def start_stream(self) -> StreamingMapper:
+        """Map the page while the crawler is still capturing it, replacing the stream of a previous crawl"""
+        if self.stream is not None:
+            self.stream.cancel()
+        self.stream = StreamingMapper(self, self.chunk_limit())
+        return self.stream
+
+    async def collect_streamed_summaries(self) -> Optional[List[str]]:
+        """Wait for the summaries mapped during the crawl, None when the page was not streamed"""
+        if self.stream is None or not self.stream.finished or not self.stream.tasks:
+            return None
+        if asyncio.get_running_loop() is self.stream.loop:
+            return await self.stream.summaries()
+        # Only sync callers going through lg_invoke run on a loop of their own
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(self.stream.summaries(), self.stream.loop))
+
     def generate_chunks(self):
         """Generate chunks from HTML content"""
         try:
-            self.split_docs = self.create_chunks()[:self.chunk_count_limit]
+            # Long pages keep the chunks that matter to the persona, not just the first ones
+            limit = self.chunk_limit()
+            self.split_docs = self.chunk_selector.select(self.create_chunks(self.chunk_size), limit,
+                                                         limit * self.chunk_size)
             self.logger.info(f"Generated {len(self.split_docs)} documents like {type(self.split_docs[0])}")
         except Exception as e:
             self.logger.error(f"Error generating chunks: {str(e)}")
@@ -126,8 +143,7 @@ class EnhancedLongContextHandler(HelperFunct):
             full_prompt = f"{prompt}\nContent: {content}"
 
             # Get analysis
-            response = await self.persona_map_chain.ainvoke({"context": full_prompt})
-            response_str = str(response)
+            response_str = await self.graph.map_chunk(full_prompt)
 
             # Create analysis section
             analysis = AnalysisSection(
@@ -148,130 +164,53 @@ class EnhancedLongContextHandler(HelperFunct):
         except Exception as e:
             error_msg = f"Error processing {section_type} analysis: {str(e)}"
             self.logger.error(error_msg)
-            self.append_to_agent_scratchpad(f"ERROR: {error_msg}")
+            self.append_to_agent_scratchpad(f"ERROR: {error_msg}", "query_site_textually", kind="error")
             raise
 
-    async def generate_summary(self, state: SummaryState) -> Dict[str, List[str]]:
-        """Generate summary using persona-specific map chain"""
-        try:
-            response = await self.persona_map_chain.ainvoke({"context": state['content']})
-            return {"summaries": [str(response)]}
-        except Exception as e:
-            self.logger.error(f"Error generating summary: {str(e)}")
-            raise
-
-    @staticmethod
-    def map_summaries(state: OverallState) -> List[Dict[str, Any]]:
-        """Map contents to summaries"""
-        return [
-            Send("generate_summary", {"content": content})
-            for content in state["contents"]
-        ]
-
-    @staticmethod
-    def collect_summaries(state: OverallState) -> Dict[str, List[Document]]:
-        """Collect summaries into documents"""
-        return {
-            "collapsed_summaries": [Document(summary) for summary in state["summaries"]]
-        }
+    def dedup_key(self) -> Optional[Tuple[str, str, str]]:
+        """Scope of the chunks already mapped on this site for this persona during the current site run"""
+        if not self.page_url or not self.site_run:
+            return None
+        return self.site_run, site_key(self.page_url), self.persona_key
 
-    async def collapse_summaries(self, state: OverallState) -> Dict[str, List[Document]]:
-        """Collapse summaries using persona-specific reduce chain"""
-        try:
-            doc_lists = split_list_of_docs(
-                state["collapsed_summaries"],
-                self.length_function,
-                self.token_max
-            )
-
-            results = []
-            for doc_list in doc_lists:
-                collapsed = await acollapse_docs(doc_list, self.reduce_chain.ainvoke)
-                results.extend(collapsed)
-
-            return {"collapsed_summaries": results}
-        except Exception as e:
-            self.logger.error(f"Error collapsing summaries: {str(e)}")
-            raise
-
-    def should_collapse(self, state: OverallState) -> Literal["collapse_summaries", "generate_final_summary"]:
-        """Determine if summaries should be collapsed"""
-        try:
-            num_tokens = self.length_function(state["collapsed_summaries"])
-            return "collapse_summaries" if num_tokens > self.token_max else "generate_final_summary"
-        except Exception as e:
-            self.logger.error(f"Error in collapse decision: {str(e)}")
-            raise
-
-    async def generate_final_summary(self, state: OverallState) -> Dict[str, str]:
-        """Generate final summary using persona-specific reduce chain"""
-        try:
-            # Combine all sections
-            section_summaries = []
-            for section_type, contents in self.analysis_sections.items():
-                if contents:
-                    summary = f"{section_type.upper()} ANALYSIS:\n"
-                    summary += "\n".join(str(content) for content in contents)
-                    section_summaries.append(summary)
-
-            all_summaries = "\n\n".join(section_summaries)
-
-            # Add collapsed summaries if they exist
-            collapsed_summaries = "\n".join([
-                doc.page_content for doc in state['collapsed_summaries']
-            ]) if 'collapsed_summaries' in state else ""
-
-            # Create final prompt
-            final_prompt = self.prompt._create_textual_website_summary_prompt(all_summaries, collapsed_summaries)
-
-            final_summary = await self.persona_reduce_chain.ainvoke({"documents": final_prompt})
-
-            summary_log = self.beau.beautify_with_logs_final_summary(final_summary)
-            self.append_to_agent_scratchpad(summary_log, "query_text_textually")
-
-            return {"final_summary": str(final_summary)}
-
-        except Exception as e:
-            error_msg = f"Error generating final summary: {str(e)}"
-            self.logger.error(error_msg)
-            raise
-
-    def build_graph(self):
-        """Build the processing graph"""
-        try:
-            graph = StateGraph(OverallState)
-
-            # Add nodes
-            graph.add_node("generate_summary", self.generate_summary)
-            graph.add_node("collect_summaries", self.collect_summaries)
-            graph.add_node("collapse_summaries", self.collapse_summaries)
-            graph.add_node("generate_final_summary", self.generate_final_summary)
-
-            # Add edges
-            graph.add_conditional_edges(START, self.map_summaries, ["generate_summary"])
-            graph.add_edge("generate_summary", "collect_summaries")
-            graph.add_conditional_edges("collect_summaries", self.should_collapse)
-            graph.add_conditional_edges("collapse_summaries", self.should_collapse)
-            graph.add_edge("generate_final_summary", END)
-
-            self.app = graph.compile()
-            self.logger.info("Graph built successfully")
-        except Exception as e:
-            self.logger.error(f"Error building graph: {str(e)}")
-            raise
-
-    async def get_result(self):
-        """Process results through the graph"""
+    async def generate_summary(self, state: SummaryState) -> Dict[str, List[str]]:
+        """Map one chunk of this run's page through the shared persona graph"""
+        return await self.graph.generate_summary({**state, "dedup_key": self.dedup_key()})
+
+    def sections_summary(self) -> str:
+        """Section analyses gathered during this run, combined for the final summary"""
+        section_summaries = []
+        for section_type, contents in self.analysis_sections.items():
+            if contents:
+                summary = f"{section_type.upper()} ANALYSIS:\n"
+                summary += "\n".join(str(content) for content in contents)
+                section_summaries.append(summary)
+        return "\n\n".join(section_summaries)
+
+    async def get_result(self, inputs: Optional[Dict[str, Any]] = None):
+        """Process results through the graph, everything specific to this run goes in through the state"""
         try:
-            async for step in self.app.astream(
-                    {"contents": [doc.page_content for doc in self.split_docs]},
-                    {"recursion_limit": self.config.recursion_limit},
+            inputs = {
+                "contents": [doc.page_content for doc in self.split_docs],
+                **(inputs or {}),
+                "sections": self.sections_summary(),
+                "token_max": self.token_max,
+                "dedup_key": self.dedup_key(),
+            }
+            async for step in self.graph.app.astream(
+                    inputs,
+                    {"recursion_limit": self.config.recursion_limit,
+                     "max_concurrency": self.graph.limiter.config.max_concurrency},
             ):
                 if "content" in step:
                     await self.process_section(
                         "textual" if "text" in step else "visual",
                         step["content"]
                     )
+                if "generate_final_summary" in step:
+                    self.summary = step["generate_final_summary"]["final_summary"]
+                    summary_log = self.beau.beautify_with_logs_final_summary(self.summary)
+                    self.append_to_agent_scratchpad(summary_log, "query_text_textually", kind="summary")
                 self.logger.debug(f"Processing step: {list(step.keys())}")
                 print(list(step.keys()), step)
             self.logger.info("Result generation completed")
@@ -279,15 +218,25 @@ class EnhancedLongContextHandler(HelperFunct):
             self.logger.error(f"Error getting results: {str(e)}")
             raise
 
-    def lg_invoke(self):
-        """Main invocation method"""
+    async def ainvoke(self):
+        """Main invocation method, awaits the whole map-reduce on the caller's event loop"""
         try:
             self.logger.info("Starting analysis process")
-            self.generate_chunks()
-            self.build_graph()
-            asyncio.run(self.get_result())
+            summaries = await self.collect_streamed_summaries()
+            if summaries is None:
+                # File reading, tokenizing and embedding calls are blocking, keep them off the loop
+                await asyncio.to_thread(self.generate_chunks)
+                inputs = None
+            else:
+                self.logger.info(f"Reusing {len(summaries)} summaries mapped while crawling")
+                inputs = {"contents": [], "summaries": summaries}
+            await self.get_result(inputs)
             self.logger.info("Analysis completed successfully")
         except Exception as e:
             error_msg = f"Error during invocation: {str(e)}"
             self.logger.error(error_msg)
-            raise
\ No newline at end of file
+            raise
+
+    def lg_invoke(self):
+        """Blocking entry point for scripts without an event loop"""
+        asyncio.run(self.ainvoke())
\ No newline at end of file
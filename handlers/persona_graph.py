@@ -0,0 +1,180 @@
+import asyncio
+import logging
+from typing import Dict, List, Literal
+
+from langchain_core.output_parsers import StrOutputParser
+from langchain.chains.combine_documents.reduce import (
+    acollapse_docs,
+    split_list_of_docs,
+)
+from langchain_core.documents import Document
+
+from states.state import SummaryState, OverallState
+from chains.map_reduce_chain import MapReduceChain
+from handlers.PersonaContextProcessor import PersonaMapReduceChain
+from llms.rate_limiter import rate_limiters
+from utils.chunk_dedup import chunk_dedup
+from utils.token_counter import count_document_tokens, count_tokens
+
+
+class PersonaGraph:
+    """Persona map/reduce chains and the compiled long-context graph, built once per persona version.
+
+    Nothing run-specific is kept here: contents, token limit, section analyses and the dedup scope
+    travel in the graph state, so a single compiled graph serves concurrent runs.
+    """
+
+    def __init__(self, prompt, map_prompt=None, reduce_prompt=None):
+        self.prompt = prompt
+        self.logger = logging.getLogger(__name__)
+        if map_prompt is None or reduce_prompt is None:
+            persona_chains = PersonaMapReduceChain(prompt.persona)
+            map_prompt = persona_chains.create_persona_map_prompt()
+            reduce_prompt = persona_chains.create_persona_reduce_prompt()
+
+        # Base reduce chain for collapsing, persona-specific chains for mapping and the final summary
+        self.llm_id = MapReduceChain.llm_id
+        self.reduce_chain = MapReduceChain.reduce_chain()
+        selected_llm = MapReduceChain.selected_llm()
+        self.persona_map_chain = map_prompt | selected_llm | StrOutputParser()
+        self.persona_reduce_chain = reduce_prompt | selected_llm | StrOutputParser()
+
+        # Every map/reduce call is scheduled against the deployment's RPM/TPM and concurrency limits
+        self.limiter = rate_limiters.get(self.llm_id)
+        self.app = self.build_graph()
+
+    def length_function(self, documents: List[Document]) -> int:
+        """Real token count of documents for the map/reduce model"""
+        return count_document_tokens(documents, self.llm_id)
+
+    async def map_chunk(self, content: str) -> str:
+        response = await self.limiter.run(
+            lambda: self.persona_map_chain.ainvoke({"context": content}),
+            count_tokens(content, self.llm_id))
+        return str(response)
+
+    async def generate_summary(self, state: SummaryState) -> Dict[str, List[str]]:
+        """Generate summary using persona-specific map chain, near-duplicates of chunks mapped on other
+        pages of the site reuse their summary"""
+        try:
+            dedup_key = state.get("dedup_key")
+            index = chunk_dedup.index(*dedup_key) if dedup_key else None
+            if index is None:
+                return {"summaries": [await self.map_chunk(state['content'])]}
+
+            # Hashing every shingle is pure Python, it runs in a worker thread. The claim itself stays on
+            # the loop so a cancelled page never owns a summary it will not resolve
+            signature = await asyncio.to_thread(index.hasher.signature, state['content'])
+            shared, owner = index.claim(state['content'], signature)
+            if not owner:
+                try:
+                    # Shielded: a cancelled page must not cancel the summary other pages wait for
+                    return {"summaries": [await asyncio.shield(asyncio.wrap_future(shared))]}
+                except RuntimeError:
+                    return {"summaries": [await self.map_chunk(state['content'])]}
+            try:
+                summary = await self.map_chunk(state['content'])
+            except BaseException:
+                index.abandon(shared)
+                raise
+            shared.set_result(summary)
+            return {"summaries": [summary]}
+        except Exception as e:
+            self.logger.error(f"Error generating summary: {str(e)}")
+            raise
+
+    @staticmethod
+    def map_summaries(state: OverallState):
+        """Map contents to summaries, streamed pages arrive with their summaries already mapped"""
+        from langgraph.constants import Send
+        if not state["contents"]:
+            return "collect_summaries"
+        return [
+            Send("generate_summary", {"content": content, "dedup_key": state.get("dedup_key")})
+            for content in state["contents"]
+        ]
+
+    @staticmethod
+    def collect_summaries(state: OverallState) -> Dict[str, List[Document]]:
+        """Collect summaries into documents"""
+        return {
+            "collapsed_summaries": [Document(summary) for summary in state["summaries"]]
+        }
+
+    async def collapse_summaries(self, state: OverallState) -> Dict[str, List[Document]]:
+        """Collapse summaries using persona-specific reduce chain"""
+        try:
+            doc_lists = split_list_of_docs(
+                state["collapsed_summaries"],
+                self.length_function,
+                state["token_max"]
+            )
+
+            # Groups are independent, the limiter bounds how many collapse at once
+            results = await asyncio.gather(*(
+                self.limiter.run(lambda doc_list=doc_list: acollapse_docs(doc_list, self.reduce_chain.ainvoke),
+                                 self.length_function(doc_list))
+                for doc_list in doc_lists
+            ))
+
+            return {"collapsed_summaries": list(results)}
+        except Exception as e:
+            self.logger.error(f"Error collapsing summaries: {str(e)}")
+            raise
+
+    def should_collapse(self, state: OverallState) -> Literal["collapse_summaries", "generate_final_summary"]:
+        """Determine if summaries should be collapsed"""
+        try:
+            num_tokens = self.length_function(state["collapsed_summaries"])
+            return "collapse_summaries" if num_tokens > state["token_max"] else "generate_final_summary"
+        except Exception as e:
+            self.logger.error(f"Error in collapse decision: {str(e)}")
+            raise
+
+    async def generate_final_summary(self, state: OverallState) -> Dict[str, str]:
+        """Generate final summary using persona-specific reduce chain"""
+        try:
+            collapsed_summaries = "\n".join([
+                doc.page_content for doc in state['collapsed_summaries']
+            ]) if 'collapsed_summaries' in state else ""
+
+            # Create final prompt
+            final_prompt = self.prompt._create_textual_website_summary_prompt(state.get("sections", ""),
+                                                                              collapsed_summaries)
+
+            final_summary = await self.limiter.run(
+                lambda: self.persona_reduce_chain.ainvoke({"documents": final_prompt}),
+                count_tokens(final_prompt, self.llm_id))
+
+            return {"final_summary": str(final_summary)}
+
+        except Exception as e:
+            error_msg = f"Error generating final summary: {str(e)}"
+            self.logger.error(error_msg)
+            raise
+
+    def build_graph(self):
+        """Build and compile the processing graph"""
+        from langgraph.graph import END, START, StateGraph
+        try:
+            graph = StateGraph(OverallState)
+
+            # Add nodes
+            graph.add_node("generate_summary", self.generate_summary)
+            graph.add_node("collect_summaries", self.collect_summaries)
+            graph.add_node("collapse_summaries", self.collapse_summaries)
+            graph.add_node("generate_final_summary", self.generate_final_summary)
+
+            # Add edges
+            graph.add_conditional_edges(START, self.map_summaries, ["generate_summary", "collect_summaries"])
+            graph.add_edge("generate_summary", "collect_summaries")
+            graph.add_conditional_edges("collect_summaries", self.should_collapse)
+            graph.add_conditional_edges("collapse_summaries", self.should_collapse)
+            graph.add_edge("generate_final_summary", END)
+
+            app = graph.compile()
+            self.logger.info("Graph built successfully")
+            return app
+        except Exception as e:
+            self.logger.error(f"Error building graph: {str(e)}")
+            raise
@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional
+
+from langchain_core.documents import Document
+
+from utils.html_extractor import BOILERPLATE_REGIONS, iter_semantic_regions
+from utils.token_counter import count_tokens
+
+
+class StreamingMapper:
+    """Turns page sections into map chunks as the crawler captures them and summarizes each chunk right away.
+
+    Content chunks are mapped as they arrive until max_chunks is reached. Later chunks are held back, and
+    once the page is complete the persona chunk selector picks the max_chunks most relevant of all of
+    them: held back chunks it keeps are mapped then, mapped chunks it leaves out are cancelled.
+    """
+
+    def __init__(self, lch, max_chunks: Optional[int] = None):
+        self.lch = lch
+        self.max_chunks = max_chunks
+        self.loop = asyncio.get_running_loop()
+        self.logger = logging.getLogger(__name__)
+        self.buffer: List[str] = []
+        self.buffer_tokens = 0
+        # Header, nav, footer and consent lines are chunked apart so other pages of the site can reuse them
+        self.boilerplate: Dict[str, List[str]] = {}
+        self.seen_lines = set()
+        # Page order: content chunks (task is None while held back) and boilerplate chunks
+        self.chunks: List[Dict] = []
+        self.content_chunks = 0
+        self.held_chunks = 0
+        self.dropped_chunks = 0
+        self.selection: Optional[asyncio.Task] = None
+        self.finished = False
+        self.started = time.monotonic()
+        self.first_summary_ms = None
+
+    def feed(self, html: str):
+        """Add one captured section; lines already seen in earlier sections are skipped"""
+        for region, line in iter_semantic_regions([html]):
+            if line in self.seen_lines:
+                continue
+            self.seen_lines.add(line)
+            if region in BOILERPLATE_REGIONS:
+                self.boilerplate.setdefault(region, []).append(line)
+                continue
+            self.buffer.append(line)
+            self.buffer_tokens += count_tokens(line, self.lch.llm_id) + 1
+            if self.buffer_tokens >= self.lch.chunk_size:
+                self._emit()
+        # A landmark usually arrives as one section, it is mapped as soon as that section is complete
+        for region in list(self.boilerplate):
+            self._schedule("\n".join(self.boilerplate.pop(region)))
+
+    @property
+    def tasks(self) -> List[asyncio.Task]:
+        return [chunk["task"] for chunk in self.chunks if chunk["task"] is not None]
+
+    def finish(self):
+        """Flush the last partial chunk, called once the page capture is complete"""
+        if self.buffer:
+            self._emit()
+        self.finished = True
+        if self.held_chunks:
+            self.selection = self.loop.create_task(self._select())
+        self.logger.info(f"Streamed {self.content_chunks + self.held_chunks} content chunks "
+                         f"({self.held_chunks} held back for relevance selection)")
+
+    def cancel(self):
+        if self.selection is not None:
+            self.selection.cancel()
+        for task in self.tasks:
+            task.cancel()
+
+    def _emit(self):
+        content = "\n".join(self.buffer)
+        self.buffer, self.buffer_tokens = [], 0
+        if self.max_chunks is not None and self.content_chunks >= self.max_chunks:
+            self.held_chunks += 1
+            self.chunks.append({"content": content, "task": None, "region": "content"})
+            return
+        self.content_chunks += 1
+        self._schedule(content, "content")
+
+    def _schedule(self, content: str, region: str = "boilerplate"):
+        self.chunks.append({"content": content, "task": self.loop.create_task(self._summarize(content)),
+                            "region": region})
+
+    async def _select(self):
+        """Keep the max_chunks content chunks most relevant to the persona, mapped or held back"""
+        content = [chunk for chunk in self.chunks if chunk["region"] == "content"]
+        documents = [Document(chunk["content"]) for chunk in content]
+        selected = await asyncio.to_thread(self.lch.chunk_selector.select, documents, self.max_chunks,
+                                           self.max_chunks * self.lch.chunk_size)
+        keep = {id(document) for document in selected}
+        for chunk, document in zip(content, documents):
+            if id(document) not in keep:
+                if chunk["task"] is not None:
+                    chunk["task"].cancel()
+                self.chunks.remove(chunk)
+                self.dropped_chunks += 1
+            elif chunk["task"] is None:
+                chunk["task"] = self.loop.create_task(self._summarize(chunk["content"]))
+        self.logger.info(f"Selected {len(selected)} of {len(content)} streamed chunks, "
+                         f"{self.dropped_chunks} dropped")
+
+    async def _summarize(self, content: str) -> str:
+        result = await self.lch.generate_summary({"content": content})
+        if self.first_summary_ms is None:
+            self.first_summary_ms = round((time.monotonic() - self.started) * 1000)
+            self.logger.info(f"First chunk summary after {self.first_summary_ms}ms")
+        return result["summaries"][0]
+
+    async def summaries(self) -> List[str]:
+        """Summaries of every kept chunk, in page order"""
+        if self.selection is not None:
+            await self.selection
+        return list(await asyncio.gather(*self.tasks))
@@ -1,4 +1,5 @@
 import subprocess
+from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import FastAPI, HTTPException, WebSocket
 from langchain_core.agents import AgentAction
@@ -8,11 +9,49 @@ import json
 from datetime import datetime
 import asyncio
 import uvicorn
-import os
-from prompts.react import Prompt
-from langchain.agents import create_react_agent, AgentExecutor
-from bson import ObjectId
-from llms.llm import LLM
+from typing import Optional
+from jobs.job_manager import FINISHED_STATUSES, JobManager, JobStatus, QueueFullError
+from handlers.agent_cache import agent_cache
+from llms.llm import llm_registry
+from llms.rate_limiter import rate_limiters
+from persona.persona_store import persona_store
+from utils.browser_pool import get_browser_pool, close_browser_pool, browser_pool_stats
+from utils.crawl_cache import crawl_cache
+from utils.chunk_dedup import chunk_dedup
+from emb.vector_index import vector_index_stats
+from utils.workspaces import workspace_manager
+
+
+async def run_job(job):
+    async for chunk in process_data(job.url, job.llm_id, job.persona_id, job.full_evaluation):
+        yield json.loads(json.dumps(chunk, default=serialize_agent_action))
+
+
+job_manager = JobManager(run_job)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    try:
+        await asyncio.to_thread(persona_store.preload)
+    except Exception as e:
+        # Personas are still loaded on demand if the preload fails
+        logging.getLogger('stella').error(f"Persona preload failed: {str(e)}")
+    try:
+        await get_browser_pool()
+    except Exception as e:
+        # The pool is started again on the first crawl if warm-up fails
+        logging.getLogger('stella').error(f"Browser pool warm-up failed: {str(e)}")
+    await job_manager.start()
+    if crawl_cache.collect not in workspace_manager.collectors:
+        workspace_manager.collectors.append(crawl_cache.collect)
+    await workspace_manager.start()
+    yield
+    await workspace_manager.stop()
+    await job_manager.stop()
+    await close_browser_pool()
+    await llm_registry.aclose()
+
 
 # Initialize FastAPI
 app = FastAPI(
@@ -20,7 +59,8 @@ app = FastAPI(
     description="API for website beta testing with virtual personas",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -61,20 +101,25 @@ class StellaRequest(BaseModel):
 
 
 # Utility to process data
-async def process_data(url: str, llm_id: str, persona_id: str):
-    os.environ["llm_id"] = llm_id
-    os.environ["persona"] = persona_id
-
-    prompt = Prompt(os.getenv("mongo_db_uri"), ObjectId(persona_id))
-    from utils.tools import crawl, query_site_visually, query_site_textually, get_links
-    llm = LLM(llm_id).get_llm()
+async def process_data(url: str, llm_id: str, persona_id: str, full_evaluation: bool = False):
+    from utils.tools import crawl, query_site_visually, query_site_textually, analyze_heatmap, get_links, \
+        generate_python_code, run_python_code, generate_feedback, check_for_feedback_reliability
+    from utils.run_context import RunContext
+    # Reload an expired persona off the event loop, the lookups below are then served from memory
+    await persona_store.aget(persona_id)
+    run_context = RunContext.create(persona_id, llm_id)
     tools = [crawl, query_site_visually, query_site_textually, get_links]
+    if full_evaluation:
+        tools = [crawl, query_site_visually, query_site_textually, analyze_heatmap, get_links, generate_python_code,
+                 run_python_code, generate_feedback, check_for_feedback_reliability]
+    # Reuse the compiled agent and executor for this model/persona
+    agent_executor = agent_cache.get(llm_id, persona_id, tools)
 
-    react_agent = create_react_agent(tools=tools, llm=llm, prompt=prompt.create_prompt_template())
-    agent_executor = AgentExecutor(agent=react_agent, tools=tools, handle_parsing_errors=True, verbose=True)
-
-    async for chunk in agent_executor.astream({"input": url}):
-        yield chunk
+    with run_context.activate():
+        async for chunk in agent_executor.astream({"input": url}, run_context.config):
+            yield chunk
+    logging.getLogger('stella').info(f"Token usage for {url}: {run_context.token_budget.stats()}",
+                                     extra={'event': 'token_usage'})
 
 
 # Helper function to serialize AgentAction objects
@@ -108,23 +153,96 @@ async def call_stella(request: StellaRequest):
     logger = setup_logging()
     logger.info(f"Starting analysis for {request.url}", extra={'event': 'tool_start'})
 
+    # Runs in the job pool like /jobs, a burst waits for a worker and memory instead of starting at once
     try:
-        result = []
-        async for chunk in process_data(request.url, request.llm_id, request.persona_id):
-            result.append(chunk)
+        job = job_manager.submit(request.url, request.llm_id, request.persona_id)
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+
+    try:
+        result = [chunk async for chunk in job_manager.follow(job)]
+        if job.status == JobStatus.FAILED:
+            raise Exception(job.error)
+        if job.status == JobStatus.CANCELLED:
+            raise HTTPException(status_code=409, detail=f"Job {job.job_id} was cancelled")
         logger.info("Stella execution completed successfully", extra={'event': 'tool_complete'})
         return {"output": result}
-    except asyncio.TimeoutError:
-        logger.error("Stella process timed out after 5 minutes", extra={'event': 'timeout'})
-        raise HTTPException(status_code=504, detail="Process timed out after 5 minutes")
+    except asyncio.CancelledError:
+        # Client went away, stop the run it was waiting for
+        job_manager.cancel(job.job_id)
+        raise
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Unexpected error: {str(e)}", extra={'event': 'error'})
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
+@app.post("/jobs", status_code=202)
+async def create_job(request: StellaRequest):
+    try:
+        job = job_manager.submit(request.url, request.llm_id, request.persona_id)
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return job.to_dict(include_output=False)
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+    return job.to_dict()
+
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    job = job_manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+    return job.to_dict(include_output=False)
+
+
+@app.delete("/agents/cache")
+async def invalidate_agents(llm_id: Optional[str] = None, persona_id: Optional[str] = None):
+    return {"invalidated": agent_cache.invalidate(llm_id, persona_id)}
+
+
+@app.delete("/personas/cache")
+async def invalidate_personas(persona_id: Optional[str] = None):
+    invalidated = persona_store.invalidate(persona_id)
+    agent_cache.invalidate(persona_id=persona_id)
+    return {"invalidated": invalidated}
+
+
+@app.delete("/llm/cache")
+async def clear_llm_cache():
+    if llm_registry.cache is None:
+        raise HTTPException(status_code=404, detail="LLM response cache is disabled")
+    await llm_registry.cache.aclear()
+    return {"cleared": True}
+
+
+@app.get("/metrics")
+async def metrics():
+    return {
+        "jobs": job_manager.stats(),
+        "agents": agent_cache.stats(),
+        "llm": llm_registry.stats(),
+        "personas": persona_store.stats(),
+        "browsers": browser_pool_stats(),
+        "crawl_cache": crawl_cache.stats(),
+        "rate_limits": rate_limiters.stats(),
+        "chunk_dedup": chunk_dedup.stats(),
+        "vector_index": vector_index_stats(),
+        "workspaces": workspace_manager.stats(),
+    }
+
+
 @app.websocket("/stream-stella")
 async def stream_stella(websocket: WebSocket):
     logger = setup_logging()
     await websocket.accept()
+    job = None
 
     try:
         # Receive parameters from the WebSocket without timeout
@@ -134,8 +252,6 @@ async def stream_stella(websocket: WebSocket):
         persona_id = data.get("persona_id")
 
         llm_id = data.get("llm_id")
-        os.environ["llm_id"] = llm_id
-        os.environ["persona"] = persona_id
 
         if not url or not llm_id or not persona_id:
             await websocket.send_json({"error": "Invalid input parameters"})
@@ -143,26 +259,17 @@ async def stream_stella(websocket: WebSocket):
 
         logger.info(f"Starting streaming analysis for {url}", extra={'event': 'tool_start'})
 
-        prompt = Prompt(os.getenv("mongo_db_uri"), ObjectId(persona_id))
-        from utils.tools import crawl, query_site_visually, query_site_textually,analyze_heatmap,  get_links, generate_python_code, run_python_code, generate_feedback, check_for_feedback_reliability
-
-        # Create agent and executor
-        llm = LLM(llm_id).get_llm()
-        tools = [crawl, query_site_visually, query_site_textually, analyze_heatmap, get_links, generate_python_code,
-                 run_python_code, generate_feedback, check_for_feedback_reliability]
-
-        # Create agent and executor
-        react_agent = create_react_agent(tools=tools, llm=llm, prompt=prompt.create_prompt_template())
-        agent_executor = AgentExecutor(agent=react_agent, tools=tools, handle_parsing_errors=True, verbose=True)
+        # The full evaluation runs in the job pool, its chunks are forwarded as the job produces them
+        try:
+            job = job_manager.submit(url, llm_id, persona_id, full_evaluation=True)
+        except QueueFullError as e:
+            await websocket.send_json({"error": str(e)})
+            return
 
-        async for chunk in agent_executor.astream({"input": url}):
-            try:
-                serializable_chunk = json.dumps(chunk, default=serialize_agent_action)
-                await websocket.send_text(serializable_chunk)
-            except TypeError as e:
-                logger.error(f"Serialization error: {e}")
-                await websocket.send_json({"error": "Serialization error"})
-                break
+        async for chunk in job_manager.follow(job):
+            await websocket.send_text(json.dumps(chunk))
+        if job.status in (JobStatus.FAILED, JobStatus.CANCELLED):
+            raise Exception(job.error or f"Job {job.job_id} was cancelled")
 
         logger.info("Stella streaming completed successfully", extra={'event': 'tool_complete'})
 
@@ -173,6 +280,9 @@ async def stream_stella(websocket: WebSocket):
         except:
             pass
     finally:
+        if job is not None and job.status not in FINISHED_STATUSES:
+            # Client disconnected mid-run
+            job_manager.cancel(job.job_id)
         try:
             await websocket.close()
         except:
@@ -0,0 +1,260 @@
+import asyncio
+import logging
+import os
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from enum import Enum
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+FINISHED_STATUSES = (JobStatus.SUCCEEDED, JobStatus.FAILED, JobStatus.CANCELLED)
+
+
+class QueueFullError(Exception):
+    """Raised when a job cannot be admitted because the queue is at capacity"""
+
+
+@dataclass
+class JobManagerConfig:
+    """Worker pool and admission budgets, overridable through the environment"""
+    workers: int = 2
+    max_queue_size: int = 50
+    memory_per_job_mb: int = 1500
+    min_free_memory_mb: int = 512
+    admission_poll_s: float = 2
+    history_size: int = 200
+
+    @classmethod
+    def from_env(cls) -> "JobManagerConfig":
+        return cls(
+            workers=int(os.getenv("job_workers", cls.workers)),
+            max_queue_size=int(os.getenv("job_max_queue_size", cls.max_queue_size)),
+            memory_per_job_mb=int(os.getenv("job_memory_per_job_mb", cls.memory_per_job_mb)),
+            min_free_memory_mb=int(os.getenv("job_min_free_memory_mb", cls.min_free_memory_mb)),
+            admission_poll_s=float(os.getenv("job_admission_poll_s", cls.admission_poll_s)),
+            history_size=int(os.getenv("job_history_size", cls.history_size)),
+        )
+
+
+@dataclass
+class Job:
+    url: str
+    llm_id: str
+    persona_id: str
+    # Crawl and analysis tools only, or the full evaluation with tests and feedback
+    full_evaluation: bool = False
+    job_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: JobStatus = JobStatus.QUEUED
+    created_at: str = field(default_factory=lambda: datetime.now().isoformat())
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    output: List[Any] = field(default_factory=list)
+    error: Optional[str] = None
+    task: Optional[asyncio.Task] = field(default=None, repr=False)
+    changed: Optional[asyncio.Event] = field(default=None, repr=False)
+
+    def to_dict(self, include_output: bool = True) -> Dict[str, Any]:
+        data = {
+            "job_id": self.job_id,
+            "url": self.url,
+            "llm_id": self.llm_id,
+            "persona_id": self.persona_id,
+            "status": self.status.value,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+        }
+        if include_output:
+            data["output"] = self.output
+        return data
+
+
+def available_memory_mb() -> Optional[float]:
+    """Memory still available to this container (cgroup v2 first, then /proc/meminfo)"""
+    try:
+        with open("/sys/fs/cgroup/memory.max") as fp:
+            limit = fp.read().strip()
+        if limit != "max":
+            with open("/sys/fs/cgroup/memory.current") as fp:
+                current = int(fp.read().strip())
+            return (int(limit) - current) / (1024 * 1024)
+    except (OSError, ValueError):
+        pass
+
+    try:
+        with open("/proc/meminfo") as fp:
+            for line in fp:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+class JobManager:
+    """In-process job queue served by a bounded pool of asyncio workers"""
+
+    def __init__(self, runner: Callable[[Job], AsyncIterator[Any]], config: Optional[JobManagerConfig] = None):
+        self.runner = runner
+        self._config = config
+        self.logger = logging.getLogger(__name__)
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self.queue: Optional[asyncio.Queue] = None
+        self.workers: List[asyncio.Task] = []
+        self.running = 0
+        # Queued jobs not cancelled yet, cancelling a queued job frees its slot right away
+        self.pending = 0
+
+    @property
+    def config(self) -> JobManagerConfig:
+        """Read from the environment on first use, the manager is built at import time before .env is loaded"""
+        if self._config is None:
+            self._config = JobManagerConfig.from_env()
+        return self._config
+
+    async def start(self):
+        self.queue = asyncio.Queue()
+        self.workers = [asyncio.create_task(self._worker(i)) for i in range(self.config.workers)]
+        self.logger.info(f"Started {self.config.workers} job workers")
+
+    async def stop(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    def submit(self, url: str, llm_id: str, persona_id: str, full_evaluation: bool = False) -> Job:
+        """Queue a new job or raise QueueFullError when the backlog is at capacity"""
+        job = Job(url=url, llm_id=llm_id, persona_id=persona_id, full_evaluation=full_evaluation)
+        if self.pending >= self.config.max_queue_size:
+            raise QueueFullError(f"Job queue is full ({self.config.max_queue_size} pending jobs)")
+        self.queue.put_nowait(job)
+        self.pending += 1
+        self.jobs[job.job_id] = job
+        self._trim_history()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    async def follow(self, job: Job) -> AsyncIterator[Any]:
+        """Output of a job as it is produced, until the job finishes"""
+        position = 0
+        while True:
+            if job.changed is None:
+                job.changed = asyncio.Event()
+            changed = job.changed
+            finished = job.status in FINISHED_STATUSES
+            while position < len(job.output):
+                yield job.output[position]
+                position += 1
+            if finished:
+                return
+            await changed.wait()
+
+    @staticmethod
+    def _notify(job: Job):
+        if job.changed is not None:
+            job.changed.set()
+            job.changed = None
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Cancel a queued or running job, finished jobs are returned untouched"""
+        job = self.jobs.get(job_id)
+        if job is None or job.status in FINISHED_STATUSES:
+            return job
+        if job.status == JobStatus.RUNNING:
+            job.task.cancel()
+        else:
+            self.pending -= 1
+            self._finish(job, JobStatus.CANCELLED)
+        return job
+
+    def stats(self) -> Dict[str, Any]:
+        counts = {status.value: 0 for status in JobStatus}
+        for job in self.jobs.values():
+            counts[job.status.value] += 1
+        return {
+            "workers": self.config.workers,
+            "running": self.running,
+            "queued": self.pending,
+            "max_queue_size": self.config.max_queue_size,
+            "available_memory_mb": available_memory_mb(),
+            "jobs": counts,
+        }
+
+    async def _worker(self, index: int):
+        while True:
+            job = await self.queue.get()
+            try:
+                if job.status == JobStatus.CANCELLED:
+                    continue
+                await self._wait_for_memory(job)
+                if job.status == JobStatus.CANCELLED:
+                    continue
+                # Running from here on, a cancel now goes to the task even if it has not started yet
+                self.pending -= 1
+                job.status = JobStatus.RUNNING
+                job.started_at = datetime.now().isoformat()
+                job.task = asyncio.create_task(self._run(job))
+                try:
+                    await job.task
+                except asyncio.CancelledError:
+                    if not job.task.cancelled():
+                        raise
+                if job.status not in FINISHED_STATUSES:
+                    # Cancelled before its first step, _run never got to record it
+                    self._finish(job, JobStatus.CANCELLED)
+            finally:
+                self.queue.task_done()
+
+    async def _wait_for_memory(self, job: Job):
+        """Hold the job in the queue until the container has room for another run"""
+        needed = self.config.memory_per_job_mb + self.config.min_free_memory_mb
+        while job.status == JobStatus.QUEUED:
+            available = available_memory_mb()
+            if available is None or available >= needed or self.running == 0:
+                return
+            self.logger.info(f"Delaying job {job.job_id}: {available:.0f}MB available, {needed}MB needed")
+            await asyncio.sleep(self.config.admission_poll_s)
+
+    async def _run(self, job: Job):
+        self.running += 1
+        try:
+            async for chunk in self.runner(job):
+                job.output.append(chunk)
+                self._notify(job)
+            self._finish(job, JobStatus.SUCCEEDED)
+        except asyncio.CancelledError:
+            self._finish(job, JobStatus.CANCELLED)
+            raise
+        except Exception as e:
+            self.logger.error(f"Job {job.job_id} failed: {str(e)}")
+            job.error = str(e)
+            self._finish(job, JobStatus.FAILED)
+        finally:
+            self.running -= 1
+
+    def _finish(self, job: Job, status: JobStatus):
+        job.status = status
+        job.finished_at = datetime.now().isoformat()
+        self._notify(job)
+
+    def _trim_history(self):
+        """Drop the oldest finished jobs once the history limit is exceeded"""
+        excess = len(self.jobs) - self.config.history_size
+        if excess <= 0:
+            return
+        for job_id in [job_id for job_id, job in self.jobs.items() if job.status in FINISHED_STATUSES][:excess]:
+            del self.jobs[job_id]
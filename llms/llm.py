@@ -3,6 +3,8 @@ from langchain_anthropic import ChatAnthropic
 
 
 import os
+import threading
+import httpx
 from dotenv import load_dotenv
 from utils.const import azure_supported_models, anthropic_supported_models
 from utils.common_utils import check_env_for_dependent_variables
@@ -10,46 +12,166 @@ from utils.common_utils import check_env_for_dependent_variables
 # Load environment variables
 load_dotenv()
 
-# Define the LLM class
-class LLM:
-    def __init__(self, llm_id):
-        self.llm_id = llm_id
-        # Validate that required variables are set
-        check_env_for_dependent_variables()
+from llms.response_cache import response_cache
 
-    def get_llm(self):
-        if self.llm_id in azure_supported_models and not self.llm_id == "gpt-o1":
-            self.llm_selected = AzureChatOpenAI(
-                azure_endpoint=os.environ[f"azure_endpoint_{self.llm_id}"],
-                api_key=os.environ[f"azure_api_key_{self.llm_id}"],
-                azure_deployment=os.environ[f"azure_deployment_{self.llm_id}"],
-                api_version=os.environ[f"azure_api_version_{self.llm_id}"],
+
+class LLMRegistry:
+    """Process-wide registry handing out one shared chat model per llm_id over pooled HTTP connections"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._env_checked = False
+        self._models = {}
+        self._http_client = None
+        self._http_async_client = None
+        self.hits = 0
+        self.misses = 0
+        # Every model answers repeated prompts from the shared disk cache
+        self.cache = response_cache if os.getenv("llm_cache_enabled", "true").lower() == "true" else None
+
+    @staticmethod
+    def _limits():
+        return httpx.Limits(
+            max_connections=int(os.getenv("llm_max_connections", 100)),
+            max_keepalive_connections=int(os.getenv("llm_max_keepalive_connections", 20)),
+            keepalive_expiry=float(os.getenv("llm_keepalive_expiry_s", 60)),
+        )
+
+    def validate_env(self):
+        """Check the model variables once per process instead of on every LLM()"""
+        if self._env_checked:
+            return
+        with self._lock:
+            if not self._env_checked:
+                check_env_for_dependent_variables()
+                self._env_checked = True
+
+    @property
+    def http_client(self) -> httpx.Client:
+        if self._http_client is None:
+            with self._lock:
+                if self._http_client is None:
+                    self._http_client = httpx.Client(limits=self._limits(), timeout=None)
+        return self._http_client
+
+    @property
+    def http_async_client(self) -> httpx.AsyncClient:
+        if self._http_async_client is None:
+            with self._lock:
+                if self._http_async_client is None:
+                    self._http_async_client = httpx.AsyncClient(limits=self._limits(), timeout=None)
+        return self._http_async_client
+
+    def get(self, llm_id, max_retries=None):
+        """Shared model for llm_id; max_retries overrides the SDK retries when a caller schedules its own"""
+        key = (llm_id, max_retries)
+        model = self._models.get(key)
+        if model is not None:
+            self.hits += 1
+            return model
+        with self._lock:
+            model = self._models.get(key)
+            if model is None:
+                self.misses += 1
+                model = self._models[key] = self._create(llm_id, max_retries)
+            else:
+                self.hits += 1
+        return model
+
+    def _create(self, llm_id, max_retries=None):
+        if llm_id in azure_supported_models and not llm_id == "gpt-o1":
+            return AzureChatOpenAI(
+                azure_endpoint=os.environ[f"azure_endpoint_{llm_id}"],
+                api_key=os.environ[f"azure_api_key_{llm_id}"],
+                azure_deployment=os.environ[f"azure_deployment_{llm_id}"],
+                api_version=os.environ[f"azure_api_version_{llm_id}"],
                 temperature=0.2,
                 max_tokens=None,
                 timeout=None,
                 streaming=True,
-                max_retries=5)
-
-        elif self.llm_id == "gpt-o1-minilla":
-            self.llm_selected = AzureChatOpenAI(
-                azure_endpoint=os.environ[f"azure_endpoint_{self.llm_id}"],
-                api_key=os.environ[f"azure_api_key_{self.llm_id}"],
-                azure_deployment=os.environ[f"azure_deployment_{self.llm_id}"],
-                api_version=os.environ[f"azure_api_version_{self.llm_id}"],
+                stream_usage=True,
+                max_retries=5 if max_retries is None else max_retries,
+                http_client=self.http_client,
+                http_async_client=self.http_async_client,
+                cache=self.cache)
+
+        elif llm_id == "gpt-o1-minilla":
+            return AzureChatOpenAI(
+                azure_endpoint=os.environ[f"azure_endpoint_{llm_id}"],
+                api_key=os.environ[f"azure_api_key_{llm_id}"],
+                azure_deployment=os.environ[f"azure_deployment_{llm_id}"],
+                api_version=os.environ[f"azure_api_version_{llm_id}"],
                 temperature=1,
                 streaming = True,
+                stream_usage=True,
                 max_tokens=None,
                 timeout=None,
-                max_retries=5)
+                max_retries=5 if max_retries is None else max_retries,
+                http_client=self.http_client,
+                http_async_client=self.http_async_client,
+                cache=self.cache)
 
-        elif self.llm_id in anthropic_supported_models:
-            self.llm_selected = ChatAnthropic(
+        elif llm_id in anthropic_supported_models:
+            # ChatAnthropic keeps its own SDK client, sharing the instance keeps its connections alive
+            return ChatAnthropic(
                 model="claude-3-5-sonnet-20240620",
-                api_key=os.environ[f"anthropic_key_{self.llm_id}"],
+                api_key=os.environ[f"anthropic_key_{llm_id}"],
                 temperature=0.2,
                 streaming=True,
                 max_tokens=1024,
                 timeout=None,
-                max_retries=2,
+                max_retries=2 if max_retries is None else max_retries,
+                cache=self.cache,
             )
-        return self.llm_selected
\ No newline at end of file
+        raise ValueError(f"Unsupported llm_id: {llm_id}")
+
+    @staticmethod
+    def _pool_stats(client):
+        """Connection counts of an httpx client, read from its underlying httpcore pool"""
+        if client is None:
+            return None
+        pool = getattr(getattr(client, "_transport", None), "_pool", None)
+        connections = list(getattr(pool, "connections", []))
+        return {
+            "connections": len(connections),
+            "idle": sum(1 for c in connections if c.is_idle()),
+            "closed": client.is_closed,
+        }
+
+    def stats(self):
+        return {
+            "models": sorted(llm_id if retries is None else f"{llm_id} (max_retries={retries})"
+                             for llm_id, retries in self._models),
+            "hits": self.hits,
+            "misses": self.misses,
+            "sync_pool": self._pool_stats(self._http_client),
+            "async_pool": self._pool_stats(self._http_async_client),
+            "response_cache": self.cache.stats() if self.cache is not None else None,
+        }
+
+    async def aclose(self):
+        """Close the pooled HTTP clients, called on server shutdown"""
+        with self._lock:
+            self._models.clear()
+            http_client, self._http_client = self._http_client, None
+            http_async_client, self._http_async_client = self._http_async_client, None
+        if http_client is not None:
+            http_client.close()
+        if http_async_client is not None:
+            await http_async_client.aclose()
+
+
+llm_registry = LLMRegistry()
+
+
+# Define the LLM class
+class LLM:
+    def __init__(self, llm_id, max_retries=None):
+        self.llm_id = llm_id
+        self.max_retries = max_retries
+        # Validate that required variables are set
+        llm_registry.validate_env()
+
+    def get_llm(self):
+        self.llm_selected = llm_registry.get(self.llm_id, self.max_retries)
+        return self.llm_selected
@@ -0,0 +1,234 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+def _env(name: str, llm_id: str, default):
+    """Per-deployment override (llm_rpm_gpt-4o) falling back to the global value (llm_rpm)"""
+    return os.getenv(f"{name}_{llm_id}", os.getenv(name, default))
+
+
+@dataclass
+class RateLimitConfig:
+    """Limits of one model deployment, 0 disables a bucket"""
+    rpm: int = 0
+    tpm: int = 0
+    max_concurrency: int = 8
+    max_retries: int = 6
+    backoff_base_s: float = 1.0
+    backoff_max_s: float = 60.0
+    completion_tokens: int = 512  # expected output per call, providers count it against TPM too
+
+    @classmethod
+    def from_env(cls, llm_id: str) -> "RateLimitConfig":
+        return cls(
+            rpm=int(_env("llm_rpm", llm_id, cls.rpm)),
+            tpm=int(_env("llm_tpm", llm_id, cls.tpm)),
+            max_concurrency=int(_env("llm_max_concurrency", llm_id, cls.max_concurrency)),
+            max_retries=int(_env("llm_rate_limit_retries", llm_id, cls.max_retries)),
+            backoff_base_s=float(_env("llm_backoff_base_s", llm_id, cls.backoff_base_s)),
+            backoff_max_s=float(_env("llm_backoff_max_s", llm_id, cls.backoff_max_s)),
+            completion_tokens=int(_env("llm_expected_completion_tokens", llm_id, cls.completion_tokens)),
+        )
+
+
+class TokenBucket:
+    """Per-minute bucket shared by every event loop and thread; callers reserve first and wait off their debt"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        """Take amount from the bucket and return how long the caller must wait before using it"""
+        with self._lock:
+            self._refill()
+            self.level -= min(amount, self.capacity)
+            return 0.0 if self.level >= 0 else -self.level / self.rate
+
+    def penalize(self, seconds: float):
+        """Empty the bucket for at least seconds, so every caller backs off after a 429"""
+        with self._lock:
+            self._refill()
+            self.level = min(self.level, -seconds * self.rate)
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    return status == 429 or type(error).__name__ == "RateLimitError"
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Delay requested by the provider through Retry-After headers, if any"""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+
+class ConcurrencySlots:
+    """Process-wide bound on calls in flight, awaited from any event loop: a freed slot is handed to the
+    oldest waiter on whichever loop it runs, so every loop of the process shares one limit"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+        self._waiters: deque = deque()
+        self._lock = threading.Lock()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self.used < self.limit and not self._waiters:
+                self.used += 1
+                return
+            waiter = loop.create_future()
+            self._waiters.append((loop, waiter))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            with self._lock:
+                try:
+                    self._waiters.remove((loop, waiter))
+                    handed_over = False
+                except ValueError:
+                    handed_over = True
+            if handed_over:
+                # The slot reached us after we were cancelled, pass it on
+                self.release()
+            raise
+
+    def release(self):
+        with self._lock:
+            while self._waiters:
+                loop, waiter = self._waiters.popleft()
+                try:
+                    loop.call_soon_threadsafe(self._wake, waiter)
+                    return
+                except RuntimeError:
+                    # Loop closed while its task was waiting, try the next waiter
+                    continue
+            self.used -= 1
+
+    @staticmethod
+    def _wake(waiter: asyncio.Future):
+        # A cancelled waiter releases the slot itself, see acquire
+        if not waiter.done():
+            waiter.set_result(None)
+
+
+class RateLimiter:
+    """Schedules calls to one deployment: bounded concurrency, RPM/TPM buckets and jittered backoff on 429"""
+
+    def __init__(self, llm_id: str, config: Optional[RateLimitConfig] = None):
+        self.llm_id = llm_id
+        self.config = config or RateLimitConfig.from_env(llm_id)
+        self.requests = TokenBucket(self.config.rpm) if self.config.rpm else None
+        self.tokens = TokenBucket(self.config.tpm) if self.config.tpm else None
+        # One bound for the whole process: runs, the API loop and to_thread workers share the deployment
+        self.slots = ConcurrencySlots(self.config.max_concurrency)
+        self.logger = logging.getLogger(__name__)
+        self.calls = 0
+        self.throttled = 0
+        self.in_flight = 0
+        self.waited_s = 0.0
+
+    def backoff(self, attempt: int, requested: Optional[float] = None) -> float:
+        """Exponential backoff with equal jitter, never shorter than what the provider asked for"""
+        delay = min(self.config.backoff_max_s, self.config.backoff_base_s * 2 ** attempt)
+        delay = delay / 2 + random.uniform(0, delay / 2)
+        return max(delay, requested or 0.0)
+
+    async def _admit(self, tokens: int):
+        wait = 0.0
+        if self.requests is not None:
+            wait = max(wait, self.requests.reserve(1))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.reserve(tokens + self.config.completion_tokens))
+        if wait > 0:
+            self.waited_s += wait
+            await asyncio.sleep(wait)
+
+    async def run(self, call: Callable[[], Awaitable[T]], tokens: int = 0) -> T:
+        """Await call() once admitted, retrying it while the provider answers 429"""
+        await self.slots.acquire()
+        try:
+            for attempt in range(self.config.max_retries + 1):
+                await self._admit(tokens)
+                self.calls += 1
+                self.in_flight += 1
+                try:
+                    return await call()
+                except Exception as e:
+                    if not is_rate_limited(e) or attempt == self.config.max_retries:
+                        raise
+                    delay = self.backoff(attempt, retry_after(e))
+                finally:
+                    self.in_flight -= 1
+                self.throttled += 1
+                self.logger.warning(f"{self.llm_id} throttled, retry {attempt + 1}/{self.config.max_retries} "
+                                    f"in {delay:.1f}s")
+                for bucket in (self.requests, self.tokens):
+                    if bucket is not None:
+                        bucket.penalize(delay)
+                await asyncio.sleep(delay)
+        finally:
+            self.slots.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rpm": self.config.rpm,
+            "tpm": self.config.tpm,
+            "max_concurrency": self.config.max_concurrency,
+            "calls": self.calls,
+            "throttled": self.throttled,
+            "in_flight": self.in_flight,
+            "waiting": self.slots.waiting,
+            "waited_s": round(self.waited_s, 2),
+        }
+
+
+class RateLimiterRegistry:
+    """One limiter per llm_id, shared by every run in the process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._limiters: Dict[str, RateLimiter] = {}
+
+    def get(self, llm_id: str) -> RateLimiter:
+        with self._lock:
+            limiter = self._limiters.get(llm_id)
+            if limiter is None:
+                limiter = self._limiters[llm_id] = RateLimiter(llm_id)
+            return limiter
+
+    def stats(self) -> Dict[str, Any]:
+        return {llm_id: limiter.stats() for llm_id, limiter in self._limiters.items()}
+
+
+rate_limiters = RateLimiterRegistry()
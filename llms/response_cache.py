@@ -0,0 +1,182 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Sequence
+
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+from langchain_core.outputs import Generation
+
+WHITESPACE = re.compile(r"\s+")
+# usage reported on a cache hit, nothing was sent to the provider
+NO_USAGE = {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0}
+
+
+def _normalize(value):
+    if isinstance(value, str):
+        return WHITESPACE.sub(" ", value).strip()
+    if isinstance(value, list):
+        return [_normalize(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _normalize(item) for key, item in value.items()}
+    return value
+
+
+def prompt_key(prompt: str, llm_string: str) -> str:
+    """Hash of the model parameters and the prompt, insensitive to whitespace-only differences"""
+    try:
+        normalized = json.dumps(_normalize(json.loads(prompt)), sort_keys=True)
+    except ValueError:
+        normalized = _normalize(prompt)
+    digest = hashlib.sha256()
+    digest.update(llm_string.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(normalized.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ResponseCache(BaseCache):
+    """SQLite cache of LLM responses shared by every model of the registry, with TTL and size-bounded LRU"""
+
+    def __init__(self, path: Optional[str] = None, max_bytes: Optional[int] = None, ttl_s: Optional[float] = None):
+        # Unset values come from the environment on first use, after .env has been loaded
+        self._path = path
+        self._max_bytes = max_bytes
+        self._ttl_s = ttl_s
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._connection = None
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.writes = 0
+
+    def _configure(self):
+        if self._path is None:
+            tmp_folder = os.getenv("tmp_folder") or os.path.join(os.getcwd(), "tmp_folder")
+            self._path = os.getenv("llm_cache_path") or os.path.join(tmp_folder, "llm_cache.sqlite")
+        if self._max_bytes is None:
+            self._max_bytes = int(os.getenv("llm_cache_max_mb", 512)) * 1024 * 1024
+        if self._ttl_s is None:
+            self._ttl_s = float(os.getenv("llm_cache_ttl_s", 7 * 86400))
+
+    @property
+    def path(self) -> str:
+        self._configure()
+        return self._path
+
+    @property
+    def max_bytes(self) -> int:
+        self._configure()
+        return self._max_bytes
+
+    @property
+    def ttl_s(self) -> float:
+        self._configure()
+        return self._ttl_s
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """Opened on first use so importing the module touches no file"""
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("""CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL)""")
+            connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+            self._size = connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            self._connection = connection
+        return self._connection
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[Sequence[Generation]]:
+        key = prompt_key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            row = self.connection.execute("SELECT value, size, created_at FROM responses WHERE key = ?",
+                                          (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, size, created_at = row
+            if now - created_at > self.ttl_s:
+                self.connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.connection.commit()
+                self._size -= size
+                self.expired += 1
+                self.misses += 1
+                return None
+            self.connection.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self.connection.commit()
+            self.hits += 1
+        generations = [loads(item) for item in json.loads(value)]
+        for generation in generations:
+            message = getattr(generation, "message", None)
+            if message is not None and getattr(message, "usage_metadata", None):
+                # Keeps run token accounting honest: a hit costs nothing
+                message.usage_metadata = dict(NO_USAGE)
+        return generations
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Generation]) -> None:
+        key = prompt_key(prompt, llm_string)
+        value = json.dumps([dumps(generation) for generation in return_val])
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            previous = self.connection.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self.connection.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                                    (key, value, size, now, now))
+            self._size += size - (previous[0] if previous else 0)
+            self.writes += 1
+            self._evict()
+            self.connection.commit()
+
+    def _evict(self):
+        """Drop least recently used responses until the cache fits in max_bytes, caller holds the lock"""
+        while self._size > self.max_bytes:
+            rows = self.connection.execute(
+                "SELECT key, size FROM responses ORDER BY accessed_at LIMIT 64").fetchall()
+            if not rows:
+                self._size = 0
+                return
+            for key, size in rows:
+                if self._size <= self.max_bytes:
+                    return
+                self.connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._size -= size
+                self.evictions += 1
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock:
+            self.connection.execute("DELETE FROM responses")
+            self.connection.commit()
+            self._size = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "writes": self.writes,
+            "size_bytes": self._size,
+            "max_bytes": self.max_bytes,
+        }
+
+
+response_cache = ResponseCache()
@@ -1,16 +1,19 @@
 import os
 import pprint
-from bson import ObjectId
 from dotenv import load_dotenv
-from prompts.react import Prompt
-from langchain.agents import create_react_agent, AgentExecutor
 import asyncio
 import logging
-from llms.llm import LLM
+import uuid
+from handlers.agent_cache import agent_cache
 from utils.tools import crawl, query_site_visually, query_site_textually, get_links, analyze_heatmap, generate_python_code, \
     generate_feedback, run_python_code, check_for_feedback_reliability
-from utils.crawl_website import WebCrawler
-from urllib.parse import urlparse
+from utils.site_crawler import SiteCrawler, site_key
+from utils.chunk_dedup import chunk_dedup
+from persona.persona_store import persona_store
+from utils.browser_pool import close_browser_pool
+from utils.crawl_cache import crawl_cache
+from utils.run_context import RunContext
+from utils.workspaces import workspace_manager
 
 # Load environment variables
 load_dotenv()
@@ -25,14 +28,14 @@ if not os.getenv("mongo_db_uri") or not os.getenv("persona") or not os.getenv("l
 
 
 def clean_urls_single_product(base_url, url_list):
-    base_domain = urlparse(base_url).netloc
+    # Same host comparison as the site crawler, www. and bare host are one site
+    base_domain = site_key(base_url)
     seen = set()
     clean_urls = []
     product_found = False
 
     for url in url_list:
-        parsed = urlparse(url)
-        if parsed.netloc == base_domain and not url.endswith('#') and '#' not in url:
+        if site_key(url) == base_domain and not url.endswith('#') and '#' not in url:
             if '/product/' in url:
                 if not product_found:
                     clean_urls.append(url)
@@ -45,51 +48,63 @@ def clean_urls_single_product(base_url, url_list):
     return clean_urls
 
 def verify_and_filter_domains(base_url, url_list):
-    base_domain = urlparse(base_url).netloc
-    return [url for url in url_list if urlparse(url).netloc == base_domain]
+    base_domain = site_key(base_url)
+    return [url for url in url_list if site_key(url) == base_domain]
 
 
 # Define main function
-async def main(url):
-    prompt = Prompt(os.getenv("mongo_db_uri"), ObjectId(os.getenv("persona")))
+async def main(url, site_run=None):
     llm_id = os.getenv("llm_id")
     # os.environ["llm_id"] = "gpt-4o" # supports gpt-4o and sonnet-3-5 does not support gpt-o1
-    # Import tools
-    llm = LLM(llm_id).get_llm()
 
     tools = [crawl, query_site_visually, query_site_textually, analyze_heatmap, get_links, generate_python_code,
              run_python_code, generate_feedback, check_for_feedback_reliability]
 
-    # Create agent and executor
-    react_agent = create_react_agent(tools=tools, llm=llm, prompt=prompt.create_prompt_template())
-    agent_executor = AgentExecutor(agent=react_agent, tools=tools, handle_parsing_errors=True, verbose=True)
+    # Reload an expired persona off the event loop, the lookups below are then served from memory
+    await persona_store.aget(os.getenv("persona"))
+    # Reuse the compiled agent and executor across urls
+    agent_executor = agent_cache.get(llm_id, os.getenv("persona"), tools)
 
     # Execute asynchronously
     chunks = []
+    run_context = RunContext.create(os.getenv("persona"), llm_id, crawl_mode=os.getenv("crawl_mode"),
+                                    site_run=site_run)
 
-    async for chunk in agent_executor.astream({"input": url}):
-        chunks.append(chunk)
-        pprint.pprint(chunk, depth=1)
+    with run_context.activate():
+        async for chunk in agent_executor.astream({"input": url}, run_context.config):
+            chunks.append(chunk)
+            pprint.pprint(chunk, depth=1)
 
     return chunks
 
+async def evaluate_site(url):
+    """Discover the site's pages in parallel, then evaluate them with bounded concurrency"""
+    site_run = uuid.uuid4().hex
+    try:
+        # Workspaces and cached captures left by earlier runs are collected before this one adds its own
+        await asyncio.to_thread(workspace_manager.collect)
+        await asyncio.to_thread(crawl_cache.collect)
+        urls = await SiteCrawler(url).crawl()
+        urls = clean_urls_single_product(url, urls)
+        logger.info(f"Evaluating {len(urls)} pages of {url}")
+
+        slots = asyncio.Semaphore(int(os.getenv("page_eval_concurrency", 2)))
+
+        async def evaluate(page_url):
+            async with slots:
+                chunks = await main(page_url, site_run)
+                logger.info(f"Execution completed for {page_url}.")
+                return chunks
+
+        return await asyncio.gather(*(evaluate(page_url) for page_url in urls))
+    finally:
+        # Boilerplate summaries are shared only within one site run
+        chunk_dedup.drop(site_run)
+        await close_browser_pool()
+
+
 if __name__ == "__main__":
 
     url = "https://askhedi.com/"
     logger.info(f"Processing URL: {url}")
-    os.environ["crawl_mode"] = "initial"
-    os.environ["crawl_mode"] = "gpt-4o"
-    llm_id = os.getenv("mongo_db_uri")
-    urls = [url]
-    wc = WebCrawler(llm_id)
-    wc.browse(url)
-    parsed_urls = list(set(wc.links))
-    if urls[0] not in parsed_urls:
-        urls.extend(parsed_urls)
-    else:
-        urls = parsed_urls
-    urls = [url for url in urls if url.strip()]
-    urls = clean_urls_single_product(url, urls)
-    for url in urls[3]:
-        chunks = asyncio.run(main(url))
-        logger.info("Execution completed.")
+    asyncio.run(evaluate_site(url))
@@ -4,16 +4,23 @@ import os
 # Load environment variables
 load_dotenv()
 
-client = MongoClient(os.environ["mongo_db_uri"])  # defaults to port 27017
-db = client['stella_main']
+_client = None
+
+
+def get_db():
+    """Connect on first use so importing this module stays free of network work"""
+    global _client
+    if _client is None:
+        _client = MongoClient(os.environ["mongo_db_uri"])  # defaults to port 27017
+    return _client['stella_main']
 
 
 def persona(persona_id):
 
-    collection = db['personas']
+    collection = get_db()['personas']
     return collection.find_one({"_id": persona_id})
 
 
 def template(template_id):
-    collection = db['templates']
-    return collection.find_one({"_id": template_id})
\ No newline at end of file
+    collection = get_db()['templates']
+    return collection.find_one({"_id": template_id})
@@ -0,0 +1,150 @@
+import asyncio
+import os
+import time
+import hashlib
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+from bson import ObjectId, json_util
+from langchain_core.prompts import ChatPromptTemplate
+
+from persona.get_persona import get_db
+from prompts.prompt_injection import PromptInjection
+from prompts.system_instructions import PersonaPromptManager
+from handlers.PersonaContextProcessor import PersonaMapReduceChain
+from utils.scratchpad_beautifier import ScratchpadBeautify
+
+
+@dataclass
+class PersonaBundle:
+    """A persona document together with every prompt artifact derived from it"""
+    persona: Dict[str, Any]
+    version: str
+    prompt: PromptInjection
+    beau: ScratchpadBeautify
+    map_prompt: ChatPromptTemplate
+    reduce_prompt: ChatPromptTemplate
+    system_prompt: str
+    loaded_at: float = field(default_factory=time.monotonic)
+    _graph: Any = field(default=None, repr=False)
+
+    @property
+    def graph(self):
+        """Long-context chains and compiled graph of this persona version, built on first use and shared by runs"""
+        if self._graph is None:
+            from handlers.persona_graph import PersonaGraph
+            self._graph = PersonaGraph(self.prompt, self.map_prompt, self.reduce_prompt)
+        return self._graph
+
+    @classmethod
+    def compile(cls, persona_data: Dict[str, Any], version: str, prompt_manager: PersonaPromptManager) -> "PersonaBundle":
+        prompt = PromptInjection(persona_data)
+        persona_chains = PersonaMapReduceChain(persona_data)
+        return cls(
+            persona=persona_data,
+            version=version,
+            prompt=prompt,
+            beau=ScratchpadBeautify(prompt),
+            map_prompt=persona_chains.create_persona_map_prompt(),
+            reduce_prompt=persona_chains.create_persona_reduce_prompt(),
+            system_prompt=prompt_manager.build_system_prompt(persona_data),
+        )
+
+
+def persona_version(persona_data: Dict[str, Any]) -> str:
+    """Content hash of a persona document, bundles are rebuilt only when it changes"""
+    return hashlib.sha1(json_util.dumps(persona_data, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class PersonaStore:
+    """Persona data-access layer: preloads every persona and serves compiled bundles from memory"""
+
+    def __init__(self, ttl: float = float(os.getenv("persona_cache_ttl_s", 600))):
+        self.ttl = ttl
+        self.logger = logging.getLogger(__name__)
+        self._bundles: Dict[str, PersonaBundle] = {}
+        self._prompt_manager: Optional[PersonaPromptManager] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    @property
+    def prompt_manager(self) -> PersonaPromptManager:
+        if self._prompt_manager is None:
+            self._prompt_manager = PersonaPromptManager(os.environ["mongo_db_uri"])
+        return self._prompt_manager
+
+    def preload(self) -> int:
+        """Load and compile all personas in one query, called at startup"""
+        count = 0
+        for persona_data in get_db()['personas'].find():
+            self._store(persona_data)
+            count += 1
+        self.logger.info(f"Preloaded {count} personas")
+        return count
+
+    def _fresh(self, persona_id) -> Optional[PersonaBundle]:
+        bundle = self._bundles.get(str(persona_id))
+        if bundle is not None and time.monotonic() - bundle.loaded_at < self.ttl:
+            return bundle
+        return None
+
+    def get(self, persona_id) -> PersonaBundle:
+        key = str(persona_id)
+        bundle = self._fresh(key)
+        if bundle is not None:
+            self.hits += 1
+            return bundle
+
+        self.misses += 1
+        persona_data = get_db()['personas'].find_one({"_id": ObjectId(key)})
+        if persona_data is None:
+            raise KeyError(f"Unknown persona {key}")
+        return self._store(persona_data)
+
+    async def aget(self, persona_id) -> PersonaBundle:
+        """get() for the event loop, a reload from Mongo runs in a worker thread"""
+        bundle = self._fresh(persona_id)
+        if bundle is not None:
+            self.hits += 1
+            return bundle
+        return await asyncio.to_thread(self.get, persona_id)
+
+    def invalidate(self, persona_id=None) -> int:
+        with self._lock:
+            if persona_id is None:
+                count = len(self._bundles)
+                self._bundles.clear()
+                return count
+            return 1 if self._bundles.pop(str(persona_id), None) is not None else 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "personas": len(self._bundles),
+            "ttl_s": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "reloads": self.reloads,
+        }
+
+    def _store(self, persona_data: Dict[str, Any]) -> PersonaBundle:
+        key = str(persona_data["_id"])
+        version = persona_version(persona_data)
+        with self._lock:
+            bundle = self._bundles.get(key)
+            if bundle is not None and bundle.version == version:
+                # Unchanged document, only the TTL is renewed
+                bundle.loaded_at = time.monotonic()
+                return bundle
+        bundle = PersonaBundle.compile(persona_data, version, self.prompt_manager)
+        with self._lock:
+            if key in self._bundles:
+                self.reloads += 1
+            self._bundles[key] = bundle
+        return bundle
+
+
+persona_store = PersonaStore()
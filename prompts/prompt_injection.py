@@ -4,6 +4,7 @@ class PromptInjection:
         self.visual_prompt = self._create_visual_prompt()
         self.code_prompt = self._create_code_prompt()
         self.context_handler_prompt = self._create_context_handler_prompt()
+        self.heatmap_prompt = self._create_heatmap_prompt()
 
     def _create_visual_prompt(self) -> str:
         """Create persona-specific visual analysis prompt"""
@@ -98,6 +99,18 @@ class PromptInjection:
         }
         return analysis_prompts
 
+    def _create_heatmap_prompt(self) -> str:
+        """Create persona-specific heatmap analysis prompt"""
+        return f"""
+        Analyze this heatmap for {self.persona['name']}, focusing on:
+        1. Attention patterns matching their needs: {', '.join(self.persona['nmb']['needs'])}
+        2. Mobile usability: {self.persona['ux']['navigation']['mobilePriority']}
+        3. Visual hierarchy for their {self.persona['ux']['visualStyle']['designStyle']} design preference
+        4. Potential barriers: {', '.join(self.persona['nmb']['barriers'])}
+
+        Consider previous visual and textual analyses to provide comprehensive insights.
+        """
+
     def _create_textual_website_summary_prompt(self, all_summaries, collapsed_summaries):
         summary = f"""
         Generate comprehensive analysis for {self.persona['name']}, considering:
@@ -1,8 +1,7 @@
 from dataclasses import dataclass
 from typing import List, Dict, Any
 from langchain_core.prompts import PromptTemplate
-from prompts.system_instructions import PersonaPromptManager
-from bson import ObjectId
+from persona.persona_store import PersonaBundle
 
 
 @dataclass
@@ -21,9 +20,8 @@ class FeedbackStructure:
 
 
 class Prompt:
-    def __init__(self, mongo_uri: str, persona_id: ObjectId):
-        self.persona_manager = PersonaPromptManager(mongo_uri)
-        self.system_prompt = self.persona_manager.create_system_prompt(persona_id)
+    def __init__(self, bundle: PersonaBundle):
+        self.system_prompt = bundle.system_prompt
 
     def create_prompt_template(self) -> PromptTemplate:
         """Create the final prompt template with emphasis on objectivity"""
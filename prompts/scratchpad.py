@@ -0,0 +1,6 @@
+compaction_template = """
+The following are earlier notes from the "{section}" step of a website analysis:
+{notes}
+condense them into shorter notes, keep every concrete finding: links, buttons, page names, issues, scores and test results
+do not add anything that is not in the notes
+"""
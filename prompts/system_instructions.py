@@ -23,8 +23,13 @@ class TestingProtocol:
 
 
 class PersonaPromptManager:
+    # One pooled client per URI, shared by every manager instance
+    _clients: Dict[str, MongoClient] = {}
+
     def __init__(self, mongo_uri: str):
-        self.client = MongoClient(mongo_uri)
+        if mongo_uri not in self._clients:
+            self._clients[mongo_uri] = MongoClient(mongo_uri)
+        self.client = self._clients[mongo_uri]
         self.db = self.client['stella_main']
         self.testing_protocols = self._initialize_testing_protocols()
 
@@ -141,7 +146,10 @@ class PersonaPromptManager:
 
     def create_system_prompt(self, persona_id: ObjectId) -> str:
         """Generate enhanced system prompt with structured testing approach"""
-        persona_data = self.get_persona(persona_id)
+        return self.build_system_prompt(self.get_persona(persona_id))
+
+    def build_system_prompt(self, persona_data: Dict[str, Any]) -> str:
+        """Render the system prompt for an already loaded persona"""
         persona_context = self.format_persona_context(persona_data)
 
         feedback_template = self._format_feedback_template()
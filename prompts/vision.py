@@ -0,0 +1,12 @@
+tile_note = """
+This image is segment {index} of {count} of the same page, from top to bottom (page pixels {top}-{bottom}).
+Only describe what is visible in this segment.
+"""
+
+merge_template = """
+The following are analyses of consecutive segments of the same web page, from top to bottom:
+{analyses}
+merge them into a single analysis of the whole page following the instructions below
+keep every concrete element, button, link and issue, do not repeat findings shared by several segments
+{query}
+"""
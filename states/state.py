@@ -1,4 +1,4 @@
-from typing import Annotated, List, Literal, TypedDict
+from typing import Annotated, List, Literal, Optional, Tuple, TypedDict
 from langchain_core.documents import Document
 import operator
 
@@ -7,6 +7,11 @@ class OverallState(TypedDict):
     summaries: Annotated[list, operator.add]
     collapsed_summaries: List[Document]
     final_summary: str
+    # Per-run inputs, the compiled graph itself is shared by every run of a persona
+    sections: str
+    token_max: int
+    dedup_key: Optional[Tuple[str, str, str]]
 
 class SummaryState(TypedDict):
-    content: str
\ No newline at end of file
+    content: str
+    dedup_key: Optional[Tuple[str, str, str]]
\ No newline at end of file
@@ -0,0 +1,145 @@
+import base64
+import io
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+MIME_TYPES = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp"}
+
+
+class ImageArtifact:
+    """An image held once in memory, its derived forms computed on first use and memoized.
+
+    The encoded bytes are the source of truth. Decoded PIL image, OpenCV array, resized and
+    cropped variants, re-encodings and base64 are derived lazily, so a screenshot is read and
+    decoded at most once per form however many tools use it. A variant built from a decoded
+    image (crop, resize, overlay) is only encoded when its bytes are needed.
+    """
+
+    def __init__(self, data: Optional[bytes] = None, format: str = "png", path: Optional[str] = None,
+                 image=None, array=None):
+        if data is None and image is None and array is None:
+            raise ValueError("An image artifact needs encoded data, a PIL image or an array")
+        self._data = data
+        self.format = "jpeg" if format.lower() == "jpg" else format.lower()
+        self.path = path
+        self._variants: Dict[Any, Any] = {}
+        self._lock = threading.RLock()
+        if image is not None:
+            self._variants["pil"] = image
+        if array is not None:
+            self._variants["bgr"] = array
+
+    @classmethod
+    def from_file(cls, path: str, format: Optional[str] = None) -> "ImageArtifact":
+        with open(path, "rb") as fp:
+            data = fp.read()
+        return cls(data, format or path.rsplit(".", 1)[-1], path=path)
+
+    @classmethod
+    def from_array(cls, array, format: str = "png") -> "ImageArtifact":
+        """Artifact of an OpenCV BGR array, encoded only when its bytes are needed"""
+        return cls(format=format, array=array)
+
+    def _memo(self, key, compute: Callable[[], Any]):
+        with self._lock:
+            if key not in self._variants:
+                self._variants[key] = compute()
+            return self._variants[key]
+
+    @property
+    def data(self) -> bytes:
+        """Encoded bytes in the artifact's own format"""
+        with self._lock:
+            if self._data is None:
+                self._data = self._encode(self.format)
+            return self._data
+
+    @property
+    def mime_type(self) -> str:
+        return MIME_TYPES.get(self.format, f"image/{self.format}")
+
+    def _encode(self, format: str) -> bytes:
+        if "pil" not in self._variants and "bgr" in self._variants:
+            import cv2
+            ok, buffer = cv2.imencode(f".{'jpg' if format == 'jpeg' else format}", self._variants["bgr"])
+            if not ok:
+                raise ValueError(f"Could not encode image as {format}")
+            return buffer.tobytes()
+        image = self.pil()
+        if format == "jpeg" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        buffer = io.BytesIO()
+        image.save(buffer, format.upper(), **({"quality": 90} if format == "jpeg" else {}))
+        return buffer.getvalue()
+
+    def pil(self):
+        """Decoded PIL image, shared: callers must not modify it in place"""
+        def decode():
+            from PIL import Image
+            if self._data is None and "bgr" in self._variants:
+                import cv2
+                return Image.fromarray(cv2.cvtColor(self._variants["bgr"], cv2.COLOR_BGR2RGB))
+            image = Image.open(io.BytesIO(self._data))
+            image.load()
+            return image
+        return self._memo("pil", decode)
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        """Width and height"""
+        if "bgr" in self._variants and "pil" not in self._variants:
+            height, width = self._variants["bgr"].shape[:2]
+            return width, height
+        return self.pil().size
+
+    def array(self):
+        """BGR uint8 array as cv2.imread returns it"""
+        def decode():
+            import cv2
+            import numpy as np
+            return cv2.imdecode(np.frombuffer(self.data, np.uint8), cv2.IMREAD_COLOR)
+        return self._memo("bgr", decode)
+
+    def rgb_array(self, size: Optional[Tuple[int, int]] = None):
+        """RGB uint8 array, resized with nearest-neighbour sampling like keras load_img(target_size=...)"""
+        def decode():
+            import numpy as np
+            from PIL import Image
+            image = self.pil().convert("RGB")
+            if size is not None and image.size != size:
+                image = image.resize(size, Image.NEAREST)
+            return np.asarray(image)
+        return self._memo(("rgb", size), decode)
+
+    def encode(self, format: Optional[str] = None) -> bytes:
+        """Encoded bytes in format, the stored bytes when it is the artifact's own format"""
+        format = "jpeg" if format == "jpg" else (format or self.format)
+        if format == self.format:
+            return self.data
+        return self._memo(("encoded", format), lambda: self._encode(format))
+
+    def base64(self, format: Optional[str] = None) -> str:
+        return self._memo(("base64", format or self.format),
+                          lambda: base64.b64encode(self.encode(format)).decode("utf-8"))
+
+    def data_url(self, format: Optional[str] = None) -> str:
+        format = format or self.format
+        return f"data:{MIME_TYPES.get(format, f'image/{format}')};base64,{self.base64(format)}"
+
+    def crop(self, box: Tuple[int, int, int, int]) -> "ImageArtifact":
+        """Region (left, upper, right, lower) as a new artifact"""
+        return self._memo(("crop", box), lambda: ImageArtifact(format=self.format, image=self.pil().crop(box)))
+
+    def resized(self, size: Tuple[int, int]) -> "ImageArtifact":
+        """The image scaled to (width, height) as a new artifact"""
+        def resize():
+            from PIL import Image
+            return ImageArtifact(format=self.format, image=self.pil().resize(size, Image.LANCZOS))
+        return self if size == self.size else self._memo(("resized", size), resize)
+
+    def save(self, path: str) -> str:
+        """Write the encoded bytes to path"""
+        with open(path, "wb") as fp:
+            fp.write(self.data)
+        self.path = path
+        return path
@@ -0,0 +1,201 @@
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
+
+
+LAUNCH_ARGS = [
+    '--no-sandbox',
+    '--disable-setuid-sandbox',
+    '--disable-dev-shm-usage'
+]
+
+
+# Put in the idle queue of a closed pool in place of a browser
+CLOSED = object()
+
+
+class PoolClosedError(RuntimeError):
+    """The pool was closed before a browser became available"""
+
+
+class PooledBrowser:
+    """A warm Firefox instance and its usage counters"""
+
+    def __init__(self, browser):
+        self.browser = browser
+        self.pages_served = 0
+        self.started_at = time.monotonic()
+
+
+class BrowserPool:
+    """Keeps warm headless browsers and hands out one isolated context per capture"""
+
+    def __init__(self, size: int = int(os.getenv("max_browsers", 2)),
+                 max_pages_per_browser: int = int(os.getenv("browser_max_pages", 50))):
+        self.size = size
+        self.max_pages_per_browser = max_pages_per_browser
+        self.logger = logging.getLogger(__name__)
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._playwright = None
+        self._idle: Optional[asyncio.Queue] = None
+        self._start_lock = asyncio.Lock()
+        self.launched = 0
+        self.recycled = 0
+        self.unhealthy = 0
+        self.contexts_served = 0
+
+    @property
+    def started(self) -> bool:
+        return self._idle is not None
+
+    async def start(self):
+        async with self._start_lock:
+            if self.started:
+                return
+            from playwright.async_api import async_playwright
+            self.loop = asyncio.get_running_loop()
+            self._playwright = await async_playwright().start()
+            launched = await asyncio.gather(*(self._launch() for _ in range(self.size)), return_exceptions=True)
+            failures = [result for result in launched if isinstance(result, BaseException)]
+            if failures:
+                # No half-started pool, the browsers that did launch are closed with playwright
+                for result in launched:
+                    if isinstance(result, PooledBrowser):
+                        await self._close_browser(result)
+                await self._playwright.stop()
+                self._playwright = None
+                raise failures[0]
+            idle = asyncio.Queue()
+            for browser in launched:
+                idle.put_nowait(browser)
+            self._idle = idle
+            self.logger.info(f"Browser pool started with {self.size} warm browsers")
+
+    async def close(self):
+        if not self.started:
+            return
+        idle, self._idle = self._idle, None
+        while not idle.empty():
+            await self._close_browser(idle.get_nowait())
+        # Wakes the callers waiting for a browser, each one passes it on to the next
+        idle.put_nowait(CLOSED)
+        await self._playwright.stop()
+        self._playwright = None
+
+    @asynccontextmanager
+    async def context(self, **context_kwargs):
+        """Borrow a browser for one isolated context, the context is closed on exit"""
+        if not self.started:
+            await self.start()
+        pooled = await self._acquire()
+        context = None
+        try:
+            context = await pooled.browser.new_context(ignore_https_errors=True, **context_kwargs)
+            yield context
+        finally:
+            if context is not None:
+                try:
+                    await context.close()
+                except Exception as e:
+                    self.logger.warning(f"Failed to close browser context: {str(e)}")
+            pooled.pages_served += 1
+            self.contexts_served += 1
+            await self._release(pooled)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": self.size,
+            "started": self.started,
+            "idle": self._idle.qsize() if self.started else 0,
+            "launched": self.launched,
+            "recycled": self.recycled,
+            "unhealthy": self.unhealthy,
+            "contexts_served": self.contexts_served,
+        }
+
+    async def _launch(self) -> PooledBrowser:
+        browser = await self._playwright.firefox.launch(headless=True, args=LAUNCH_ARGS)
+        self.launched += 1
+        return PooledBrowser(browser)
+
+    async def _acquire(self) -> PooledBrowser:
+        idle = self._idle
+        if idle is None:
+            raise PoolClosedError("The browser pool is closed")
+        pooled = await idle.get()
+        if pooled is CLOSED:
+            idle.put_nowait(CLOSED)
+            raise PoolClosedError("The browser pool was closed while waiting for a browser")
+        if not pooled.browser.is_connected():
+            # Health check: a crashed browser is replaced before it is handed out
+            self.unhealthy += 1
+            self.logger.warning("Replacing disconnected browser")
+            try:
+                pooled = await self._launch()
+            except Exception:
+                idle.put_nowait(pooled)
+                raise
+        return pooled
+
+    async def _release(self, pooled: PooledBrowser):
+        if pooled.pages_served >= self.max_pages_per_browser and self.started:
+            self.recycled += 1
+            await self._close_browser(pooled)
+            try:
+                pooled = await self._launch()
+            except Exception as e:
+                # Keep the slot, the health check relaunches it on next use
+                self.logger.error(f"Failed to recycle browser: {str(e)}")
+        if self.started:
+            self._idle.put_nowait(pooled)
+        else:
+            await self._close_browser(pooled)
+
+    async def _close_browser(self, pooled: PooledBrowser):
+        try:
+            await pooled.browser.close()
+        except Exception as e:
+            self.logger.warning(f"Failed to close browser: {str(e)}")
+
+
+_pool: Optional[BrowserPool] = None
+
+
+async def get_browser_pool() -> BrowserPool:
+    """Return the process pool, starting it on first use in the running event loop"""
+    global _pool
+    loop = asyncio.get_running_loop()
+    if _pool is None or (_pool.loop is not None and _pool.loop is not loop):
+        # Playwright objects are bound to the loop that created them
+        stale, _pool = _pool, BrowserPool()
+        if stale is not None:
+            await _close_stale(stale)
+    if not _pool.started:
+        await _pool.start()
+    return _pool
+
+
+async def _close_stale(pool: BrowserPool):
+    """Close a pool started in another event loop, on that loop"""
+    if pool.loop.is_running() and not pool.loop.is_closed():
+        try:
+            await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(pool.close(), pool.loop))
+        except Exception as e:
+            pool.logger.warning(f"Failed to close the browser pool of another event loop: {str(e)}")
+    elif pool.started:
+        # Nothing can run on its loop any more, close_browser_pool() should have been awaited before it ended
+        pool.logger.warning("Dropping a browser pool whose event loop has stopped, its browsers were not closed")
+
+
+async def close_browser_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+def browser_pool_stats() -> Dict[str, Any]:
+    return _pool.stats() if _pool is not None else {"started": False}
@@ -0,0 +1,152 @@
+import hashlib
+import logging
+import os
+import random
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+
+WORDS = re.compile(r"\w+")
+DIGITS = re.compile(r"\d")
+MERSENNE_PRIME = (1 << 61) - 1
+
+
+class MinHasher:
+    """MinHash signatures over word shingles, digits folded so dates and counters do not break matches"""
+
+    def __init__(self, num_perm: int = 64, shingle_size: int = 5, seed: int = 1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.permutations = [(rng.randrange(1, MERSENNE_PRIME), rng.randrange(0, MERSENNE_PRIME))
+                             for _ in range(num_perm)]
+
+    def shingles(self, text: str) -> set:
+        words = WORDS.findall(DIGITS.sub("0", text.lower()))
+        k = self.shingle_size
+        if len(words) <= k:
+            return {" ".join(words)}
+        return {" ".join(words[i:i + k]) for i in range(len(words) - k + 1)}
+
+    def signature(self, text: str) -> Tuple[int, ...]:
+        hashes = [int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+                  for shingle in self.shingles(text)]
+        return tuple(min((a * h + b) % MERSENNE_PRIME for h in hashes) for a, b in self.permutations)
+
+    @staticmethod
+    def similarity(first: Tuple[int, ...], second: Tuple[int, ...]) -> float:
+        """Estimated Jaccard similarity of the two shingle sets"""
+        return sum(1 for x, y in zip(first, second) if x == y) / len(first)
+
+
+class ChunkIndex:
+    """Chunks already mapped for one site and persona, found again through LSH banding of their signatures.
+
+    Each chunk gets a future holding its summary: the first page to see a block maps it, later pages
+    (including ones running concurrently on other event loops) wait for and reuse that summary.
+    """
+
+    def __init__(self, hasher: MinHasher, bands: int, threshold: float):
+        self.hasher = hasher
+        self.bands = bands
+        self.rows = hasher.num_perm // bands
+        self.threshold = threshold
+        self.entries: List[Optional[Tuple[Tuple[int, ...], Future]]] = []
+        self.buckets: Dict[Tuple[int, Tuple[int, ...]], List[int]] = {}
+        self._lock = threading.Lock()
+        self.mapped = 0
+        self.reused = 0
+
+    def _band_keys(self, signature: Tuple[int, ...]):
+        return [(band, signature[band * self.rows:(band + 1) * self.rows]) for band in range(self.bands)]
+
+    def claim(self, text: str, signature: Optional[Tuple[int, ...]] = None) -> Tuple[Future, bool]:
+        """Future of the summary for text and whether the caller owns it, an owner must resolve or abandon it"""
+        if signature is None:
+            signature = self.hasher.signature(text)
+        keys = self._band_keys(signature)
+        with self._lock:
+            best, best_similarity = None, self.threshold
+            for key in keys:
+                for position in self.buckets.get(key, ()):
+                    entry = self.entries[position]
+                    if entry is None:
+                        continue
+                    similarity = self.hasher.similarity(signature, entry[0])
+                    if similarity >= best_similarity:
+                        best, best_similarity = entry, similarity
+            if best is not None:
+                self.reused += 1
+                return best[1], False
+
+            future = Future()
+            position = len(self.entries)
+            self.entries.append((signature, future))
+            for key in keys:
+                self.buckets.setdefault(key, []).append(position)
+            self.mapped += 1
+            return future, True
+
+    def abandon(self, future: Future):
+        """Forget a chunk whose mapping failed, callers waiting on it map the chunk themselves"""
+        with self._lock:
+            for position, entry in enumerate(self.entries):
+                if entry is not None and entry[1] is future:
+                    self.entries[position] = None
+                    self.mapped -= 1
+        if not future.done():
+            future.set_exception(RuntimeError("Mapping of the shared chunk failed"))
+
+    def stats(self) -> Dict[str, Any]:
+        return {"chunks": sum(1 for entry in self.entries if entry is not None),
+                "mapped": self.mapped, "reused": self.reused}
+
+
+class ChunkDedupRegistry:
+    """One chunk index per (site run, site, persona), dropped when the site run ends; the least recently
+    used indexes go first if runs pile up"""
+
+    def __init__(self, enabled: bool = os.getenv("chunk_dedup_enabled", "true").lower() == "true",
+                 threshold: float = float(os.getenv("chunk_dedup_threshold", 0.8)),
+                 max_sites: int = int(os.getenv("chunk_dedup_max_sites", 32)),
+                 num_perm: int = 64, bands: int = 8):
+        self.enabled = enabled
+        self.threshold = threshold
+        self.max_sites = max_sites
+        self.bands = bands
+        self.hasher = MinHasher(num_perm)
+        self.logger = logging.getLogger(__name__)
+        self._indexes: "OrderedDict[Tuple[str, str, str], ChunkIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def index(self, run: str, site: str, scope: str) -> Optional[ChunkIndex]:
+        if not self.enabled or not run or not site:
+            return None
+        key = (run, site, scope)
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is None:
+                index = self._indexes[key] = ChunkIndex(self.hasher, self.bands, self.threshold)
+                while len(self._indexes) > self.max_sites:
+                    self._indexes.popitem(last=False)
+            else:
+                self._indexes.move_to_end(key)
+            return index
+
+    def drop(self, run: str) -> int:
+        """Forget every index of a site run once it is over, a later run maps its chunks afresh"""
+        with self._lock:
+            keys = [key for key in self._indexes if key[0] == run]
+            for key in keys:
+                index = self._indexes.pop(key)
+                self.logger.info(f"Chunk dedup for {key}: {index.stats()}")
+        return len(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {f"{run} {site} {scope}": index.stats() for (run, site, scope), index in self._indexes.items()}
+
+
+chunk_dedup = ChunkDedupRegistry()
@@ -3,3 +3,10 @@
 
 azure_supported_models = ["gpt-4o", "gpt-o1-minilla", "gpt-o1"]
 anthropic_supported_models = ["sonnet-3-5"]
+
+# tiktoken encoding used to count tokens per model, Claude has no public tokenizer so cl100k_base approximates it
+model_tokenizers = {"gpt-4o": "o200k_base", "gpt-o1-minilla": "o200k_base", "gpt-o1": "o200k_base",
+                    "sonnet-3-5": "cl100k_base"}
+model_context_windows = {"gpt-4o": 128000, "gpt-o1-minilla": 128000, "gpt-o1": 200000, "sonnet-3-5": 200000}
+# How each model sizes and bills image inputs, see vision.preprocess
+model_image_pricing = {"gpt-4o": "openai", "gpt-o1-minilla": "openai", "gpt-o1": "openai", "sonnet-3-5": "anthropic"}
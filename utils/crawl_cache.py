@@ -0,0 +1,335 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from dataclasses import dataclass, asdict, field
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+MB = 1024 * 1024
+# Objects are written before the entry that references them, younger unreferenced objects are kept
+ORPHAN_GRACE_S = 600
+
+
+def sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+@dataclass
+class Validators:
+    """What the origin says about a url right now, from a cheap request without the browser"""
+    fresh: bool = False
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    raw_hash: Optional[str] = None
+
+
+@dataclass
+class CacheEntry:
+    url: str
+    html_hash: str
+    screenshot_hash: str
+    links: List[str] = field(default_factory=list)
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    raw_hash: Optional[str] = None
+    fetched_at: float = field(default_factory=time.time)
+
+
+class CrawlCache:
+    """Content-addressed disk cache of rendered pages (HTML, screenshot, links) keyed by url"""
+
+    def __init__(self, root: Optional[str] = None, max_age_s: Optional[float] = None,
+                 max_bytes: Optional[int] = None, enabled: Optional[bool] = None):
+        # Unset values come from the environment on first use, after .env has been loaded
+        self._root = root
+        self._max_age_s = max_age_s
+        self._max_bytes = max_bytes
+        self._enabled = enabled
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.hash_matches = 0
+        self.stores = 0
+        self.entries = 0
+        self.usage_bytes = 0
+        self.evicted_entries = 0
+        self.evicted_objects = 0
+        self.evicted_bytes = 0
+        self.gc_passes = 0
+        self.last_gc_at: Optional[float] = None
+
+    def _configure(self):
+        if self._root is None:
+            tmp_folder = os.getenv("tmp_folder") or os.path.join(os.getcwd(), "tmp_folder")
+            self._root = os.getenv("crawl_cache_dir") or os.path.join(tmp_folder, "crawl_cache")
+        if self._max_age_s is None:
+            self._max_age_s = float(os.getenv("crawl_cache_max_age_s", 86400))
+        if self._max_bytes is None:
+            self._max_bytes = int(os.getenv("crawl_cache_max_mb", 1024)) * MB
+        if self._enabled is None:
+            self._enabled = os.getenv("crawl_cache_enabled", "true").lower() == "true"
+
+    @property
+    def root(self) -> str:
+        self._configure()
+        return self._root
+
+    @property
+    def entries_dir(self) -> str:
+        return os.path.join(self.root, "entries")
+
+    @property
+    def objects_dir(self) -> str:
+        return os.path.join(self.root, "objects")
+
+    @property
+    def max_age_s(self) -> float:
+        self._configure()
+        return self._max_age_s
+
+    @property
+    def max_bytes(self) -> int:
+        self._configure()
+        return self._max_bytes
+
+    @property
+    def enabled(self) -> bool:
+        self._configure()
+        return self._enabled
+
+    def _entry_path(self, url: str) -> str:
+        return os.path.join(self.entries_dir, sha256(url.encode("utf-8")) + ".json")
+
+    def _object_path(self, digest: str, ext: str) -> str:
+        return os.path.join(self.objects_dir, digest[:2], f"{digest}.{ext}")
+
+    @staticmethod
+    def _atomic_write(path: str, data: bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as fp:
+            fp.write(data)
+        os.replace(tmp_path, path)
+
+    def lookup(self, url: str) -> Optional[CacheEntry]:
+        if not self.enabled:
+            return None
+        try:
+            with open(self._entry_path(url)) as fp:
+                entry = CacheEntry(**json.load(fp))
+        except (OSError, ValueError, TypeError):
+            return None
+        if time.time() - entry.fetched_at > self.max_age_s:
+            return None
+        if not os.path.exists(self._object_path(entry.html_hash, "html")) or \
+                not os.path.exists(self._object_path(entry.screenshot_hash, "png")):
+            return None
+        return entry
+
+    async def validate(self, url: str, entry: Optional[CacheEntry] = None) -> Validators:
+        """Conditional GET against the origin: 304 or an identical raw HTML hash means the entry is fresh"""
+        headers = {}
+        if entry is not None and entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry is not None and entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+        try:
+            async with httpx.AsyncClient(follow_redirects=True, timeout=10) as client:
+                response = await client.get(url, headers=headers)
+        except httpx.HTTPError as e:
+            self.logger.warning(f"Revalidation request failed for {url}: {str(e)}")
+            return Validators()
+
+        if response.status_code == 304 and entry is not None:
+            self.not_modified += 1
+            self._refresh(url, entry)
+            return Validators(True, entry.etag, entry.last_modified, entry.raw_hash)
+        if response.status_code != 200:
+            return Validators()
+
+        validators = Validators(
+            etag=response.headers.get("etag"),
+            last_modified=response.headers.get("last-modified"),
+            raw_hash=sha256(response.content),
+        )
+        if entry is not None and entry.raw_hash == validators.raw_hash:
+            self.hash_matches += 1
+            validators.fresh = True
+            entry.etag, entry.last_modified = validators.etag, validators.last_modified
+            self._refresh(url, entry)
+        return validators
+
+    def _refresh(self, url: str, entry: CacheEntry):
+        """The origin confirmed the entry, it is valid for another max_age_s"""
+        entry.fetched_at = time.time()
+        try:
+            self._atomic_write(self._entry_path(url), json.dumps(asdict(entry)).encode("utf-8"))
+        except OSError as e:
+            self.logger.warning(f"Could not refresh the crawl cache entry of {url}: {str(e)}")
+
+    def restore(self, entry: CacheEntry, html_path: str, screenshot_path: str) -> bool:
+        """Copy the cached artifacts into a run workspace, False when they were evicted meanwhile"""
+        try:
+            shutil.copyfile(self._object_path(entry.html_hash, "html"), html_path)
+            shutil.copyfile(self._object_path(entry.screenshot_hash, "png"), screenshot_path)
+        except OSError as e:
+            self.logger.warning(f"Cached capture of {entry.url} is gone: {str(e)}")
+            return False
+        self.hits += 1
+        return True
+
+    def store(self, url: str, html: str, screenshot: bytes, links: List[str], validators: Validators) -> Optional[CacheEntry]:
+        if not self.enabled:
+            return None
+        html_bytes = html.encode("utf-8")
+        entry = CacheEntry(
+            url=url,
+            html_hash=sha256(html_bytes),
+            screenshot_hash=sha256(screenshot),
+            links=list(links),
+            etag=validators.etag,
+            last_modified=validators.last_modified,
+            raw_hash=validators.raw_hash,
+        )
+        for digest, ext, data in ((entry.html_hash, "html", html_bytes), (entry.screenshot_hash, "png", screenshot)):
+            path = self._object_path(digest, ext)
+            if not os.path.exists(path):
+                self._atomic_write(path, data)
+        self._atomic_write(self._entry_path(url), json.dumps(asdict(entry)).encode("utf-8"))
+        self.stores += 1
+        return entry
+
+    def _remove(self, path: str) -> int:
+        """Bytes freed by deleting path, 0 when it could not be removed"""
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+            return size
+        except FileNotFoundError:
+            return 0
+        except OSError as e:
+            self.logger.error(f"Could not remove {path}: {str(e)}")
+            return 0
+
+    def _load_entries(self):
+        """Path and entry of every readable entry file, unreadable ones are removed"""
+        try:
+            names = os.listdir(self.entries_dir)
+        except FileNotFoundError:
+            return []
+        entries = []
+        for name in names:
+            path = os.path.join(self.entries_dir, name)
+            if not name.endswith(".json"):
+                try:
+                    # Left behind by a write that never completed
+                    if name.endswith(".tmp") and time.time() - os.path.getmtime(path) > ORPHAN_GRACE_S:
+                        self._remove(path)
+                except OSError:
+                    pass
+                continue
+            try:
+                with open(path) as fp:
+                    entries.append((path, CacheEntry(**json.load(fp))))
+            except FileNotFoundError:
+                continue
+            except (OSError, ValueError, TypeError):
+                self._remove(path)
+        return entries
+
+    def _load_objects(self):
+        """Size and modification time of every object file, keyed by its file name"""
+        objects = {}
+        for root, _, files in os.walk(self.objects_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                objects[name] = (path, stat.st_size, stat.st_mtime)
+        return objects
+
+    def collect(self) -> Dict[str, Any]:
+        """One garbage collection pass: expired entries, then the oldest ones down to max_bytes,
+        then every object no entry references any more"""
+        now = time.time()
+        entries, evicted_entries = [], 0
+        for path, entry in self._load_entries():
+            if now - entry.fetched_at > self.max_age_s:
+                self._remove(path)
+                evicted_entries += 1
+            else:
+                entries.append((entry.fetched_at, path, entry))
+        entries.sort(key=lambda item: item[0])
+        objects = self._load_objects()
+
+        def object_names(entry: CacheEntry):
+            return (f"{entry.html_hash}.html", f"{entry.screenshot_hash}.png")
+
+        references: Dict[str, int] = {}
+        for _, _, entry in entries:
+            for name in object_names(entry):
+                references[name] = references.get(name, 0) + 1
+        usage = sum(objects[name][1] for name in references if name in objects)
+
+        # Oldest captures first until the referenced objects fit in the disk budget
+        while entries and usage > self.max_bytes:
+            _, path, entry = entries.pop(0)
+            self._remove(path)
+            evicted_entries += 1
+            for name in object_names(entry):
+                references[name] -= 1
+                if references[name] == 0:
+                    del references[name]
+                    usage -= objects[name][1] if name in objects else 0
+
+        evicted_objects, evicted_bytes = 0, 0
+        for name, (path, size, mtime) in objects.items():
+            if name not in references and now - mtime > ORPHAN_GRACE_S:
+                freed = self._remove(path)
+                if freed:
+                    evicted_objects += 1
+                    evicted_bytes += freed
+
+        with self._lock:
+            self.entries = len(entries)
+            self.usage_bytes = usage
+            self.evicted_entries += evicted_entries
+            self.evicted_objects += evicted_objects
+            self.evicted_bytes += evicted_bytes
+            self.gc_passes += 1
+            self.last_gc_at = now
+        if evicted_entries or evicted_objects:
+            self.logger.info(f"Evicted {evicted_entries} crawl cache entries and {evicted_objects} objects "
+                             f"({evicted_bytes / MB:.1f} MB), {len(entries)} left using {usage / MB:.1f} MB")
+        return self.stats()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+            "hash_matches": self.hash_matches,
+            "stores": self.stores,
+            "entries": self.entries,
+            "usage_mb": round(self.usage_bytes / MB, 1),
+            "max_mb": round(self.max_bytes / MB, 1),
+            "evicted_entries": self.evicted_entries,
+            "evicted_objects": self.evicted_objects,
+            "evicted_mb": round(self.evicted_bytes / MB, 1),
+            "gc_passes": self.gc_passes,
+            "last_gc_at": self.last_gc_at,
+        }
+
+
+crawl_cache = CrawlCache()
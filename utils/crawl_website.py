@@ -1,45 +1,200 @@
-from playwright.sync_api import sync_playwright
+import asyncio
+import logging
+import threading
 import time
-from PIL import Image
 import os
+from typing import Optional
+from utils.artifacts import ImageArtifact
 from utils.file_utils import FileUtils
-from llms.llm import anthropic_supported_models
+from utils.browser_pool import get_browser_pool
+from utils.crawl_cache import Validators, crawl_cache, sha256
+from utils.page_readiness import ReadinessConfig, await_ready, wait_until_ready
+
+
+LINKS_SCRIPT = '''() => {
+                    const anchorElements = Array.from(document.querySelectorAll('a'));
+                    return anchorElements.map(anchor => anchor.href);
+                }'''
+
+# Returns the outer HTML of top-level page sections that reached the viewport since the previous call,
+# or of every section not sent yet when everything is true. Tall wrappers are split into their children
+# so a section stays close to one screen of content.
+SECTIONS_SCRIPT = '''(everything) => {
+                    const sent = window.__stellaSent || (window.__stellaSent = new WeakSet());
+                    const out = [];
+                    if (!window.__stellaHeadSent) {
+                        window.__stellaHeadSent = true;
+                        const description = document.querySelector('meta[name="description"]');
+                        out.push(`<title>${document.title}</title>` + (description ? description.outerHTML : ''));
+                    }
+                    const viewport = window.innerHeight;
+                    const visit = (element) => {
+                        for (const child of element.children) {
+                            if (sent.has(child) || ['SCRIPT', 'STYLE', 'NOSCRIPT', 'TEMPLATE'].includes(child.tagName)) {
+                                continue;
+                            }
+                            const rect = child.getBoundingClientRect();
+                            if (!everything && rect.top >= viewport) {
+                                continue;
+                            }
+                            if (rect.height > 2 * viewport && child.children.length > 1) {
+                                visit(child);
+                                continue;
+                            }
+                            sent.add(child);
+                            out.push(child.outerHTML);
+                        }
+                    };
+                    if (document.body) {
+                        visit(document.body);
+                    }
+                    return out;
+                }'''
+
+# Caps the number of Firefox instances launched by the standalone sync crawler
+browser_slots = threading.BoundedSemaphore(int(os.getenv("max_browsers", 2)))
 
 
 class WebCrawler:
 
-    def __init__(self, llm_id):
-        # Set tmp_folder environment variable
-        if not os.getenv("tmp_folder"):
-            os.environ["tmp_folder"] = os.path.join(os.getcwd(), "tmp_folder")
-            tmp_folder = os.environ["tmp_folder"]
-            os.makedirs(tmp_folder)
-        else:
-            tmp_folder = os.environ["tmp_folder"]
+    def __init__(self, llm_id, tmp_folder=None, mode=None):
+        # Runs pass their own workspace, standalone crawls fall back to the shared tmp_folder
+        if tmp_folder is None:
+            tmp_folder = os.getenv("tmp_folder") or os.path.join(os.getcwd(), "tmp_folder")
+        os.makedirs(tmp_folder, exist_ok=True)
 
         self.file_utils = FileUtils(tmp_folder)
         self.llm_id = llm_id
+        self.screenshot: Optional[ImageArtifact] = None
         self.links = []
-        self.mode = os.getenv("crawl_mode")
+        self.mode = mode
+        self.readiness = ReadinessConfig()
+        self.scroll_distance = int(os.getenv("crawl_scroll_distance", 15000))
+        self.stream_pause_ms = int(os.getenv("crawl_stream_pause_ms", 150))
+        self.timings = {}
+        self.logger = logging.getLogger(__name__)
+
+
+    def keep_screenshot(self, screenshot: ImageArtifact):
+        """Hold the full-page capture in memory and write it to the workspace once, vision.preprocess sizes
+        and tiles it for each model"""
+        if screenshot.path != self.file_utils.screenshot_path:
+            screenshot.save(self.file_utils.screenshot_path)
+        self.screenshot = screenshot
+
+
+    def _record_timings(self, site_url, started, navigated, ready, readiness):
+        """Keep and log where the capture time went: navigation, readiness phases, capture"""
+        self.timings = {
+            "navigation_ms": round((navigated - started) * 1000),
+            "readiness": {k: round(v) if isinstance(v, float) else v for k, v in readiness.items()},
+            "capture_ms": round((time.monotonic() - ready) * 1000),
+            "total_ms": round((time.monotonic() - started) * 1000),
+        }
+        self.logger.info(f"Captured {site_url}: {self.timings}")
 
+    def get_links(self, page):
+        self.links = page.evaluate(LINKS_SCRIPT)
+        return self.links
 
-    def compress_image(self):
-        img = Image.open(self.file_utils.screenshot_path)
-        img_w, img_h = img.size
-        img = img.crop([0,0, img_w, img_h//3])
-        img.save(self.file_utils.screenshot_path, "png")
+    async def abrowse(self, site_url, on_section=None):
+        """Capture a page with a warm browser from the shared pool, without blocking the event loop.
+        on_section receives page sections as HTML while the page is still being scrolled"""
+        # A cached capture is revalidated against the origin, unchanged pages skip the render
+        entry = crawl_cache.lookup(site_url)
+        validation = asyncio.create_task(crawl_cache.validate(site_url, entry)) if entry is not None else None
+        try:
+            if validation is not None and (await validation).fresh and \
+                    crawl_cache.restore(entry, self.file_utils.html_path, self.file_utils.screenshot_path):
+                if self.mode != "tool_mode":
+                    self.links = entry.links
+                self.keep_screenshot(ImageArtifact.from_file(self.file_utils.screenshot_path))
+                if on_section is not None:
+                    on_section(self.file_utils.read_file(self.file_utils.html_path))
+                self.logger.info(f"Served {site_url} from the crawl cache")
+                return
+            if crawl_cache.enabled:
+                crawl_cache.misses += 1
+            await self._render(site_url, on_section)
+        finally:
+            if validation is not None and not validation.done():
+                validation.cancel()
+
+    async def _validators(self, response):
+        """Validators of the navigation response, what later revalidations compare against"""
+        if response is None or response.status != 200:
+            return Validators()
+        try:
+            body = await response.body()
+        except Exception as e:
+            self.logger.warning(f"Could not read the document of {response.url}: {str(e)}")
+            body = None
+        return Validators(
+            etag=response.headers.get("etag"),
+            last_modified=response.headers.get("last-modified"),
+            raw_hash=sha256(body) if body is not None else None,
+        )
+
+    async def _stream_sections(self, page, on_section):
+        """Scroll one viewport at a time, handing each newly visible section to on_section"""
+        viewport = page.viewport_size or {"height": 720}
+        scrolled = 0
+        while True:
+            for section in await page.evaluate(SECTIONS_SCRIPT, False):
+                on_section(section)
+            at_bottom = await page.evaluate(
+                "() => window.scrollY + window.innerHeight >= document.documentElement.scrollHeight")
+            if scrolled >= self.scroll_distance or at_bottom:
+                return
+            await page.mouse.wheel(0, viewport["height"])
+            scrolled += viewport["height"]
+            await page.wait_for_timeout(self.stream_pause_ms)
+
+    async def _render(self, site_url, on_section=None):
+        pool = await get_browser_pool()
+        async with pool.context() as context:
+            try:
+                page = await context.new_page()
+                started = time.monotonic()
 
+                # Navigate to the URL with a timeout
+                response = await page.goto(site_url,
+                                           wait_until='domcontentloaded',
+                                           timeout=30000)  # 30 seconds timeout
+                navigated = time.monotonic()
+
+                # Scroll the page so lazy content starts loading, then wait for it to settle
+                if on_section is None:
+                    await page.mouse.wheel(0, self.scroll_distance)
+                else:
+                    await self._stream_sections(page, on_section)
+                readiness = await await_ready(page, self.readiness)
+                ready = time.monotonic()
+                if on_section is not None:
+                    # Sections below the scrolled range or that only appeared while the page settled
+                    for section in await page.evaluate(SECTIONS_SCRIPT, True):
+                        on_section(section)
+
+                links = await page.evaluate(LINKS_SCRIPT)
+                if self.mode != "tool_mode":
+                    self.links = links
 
-    def get_links(self, page):
-        self.links = page.evaluate('''() => {
-                    const anchorElements = Array.from(document.querySelectorAll('a'));
-                    return anchorElements.map(anchor => anchor.href);
-                }''')
-        return self.links
+                # Save the page content and screenshot
+                html = await page.content()
+                self.file_utils.write_file(self.file_utils.html_path, html)
+                screenshot = await page.screenshot(full_page=True)
+                if crawl_cache.enabled:
+                    crawl_cache.store(site_url, html, screenshot, links, await self._validators(response))
+                self.keep_screenshot(ImageArtifact(screenshot))
+                self._record_timings(site_url, started, navigated, ready, readiness)
+            except Exception as e:
+                print(f"Error during browsing: {str(e)}")
+                raise e
 
 
     def browse(self, site_url):
-        with sync_playwright() as p:
+        from playwright.sync_api import sync_playwright
+        with browser_slots, sync_playwright() as p:
             try:
                 # Launch Firefox in headless mode with specific arguments
                 browser = p.firefox.launch(
@@ -55,13 +210,18 @@ class WebCrawler:
                 context = browser.new_context(ignore_https_errors=True)
                 page = context.new_page()
 
+                started = time.monotonic()
+
                 # Navigate to the URL with a timeout
                 page.goto(site_url,
-                          wait_until='networkidle',
+                          wait_until='domcontentloaded',
                           timeout=30000)  # 30 seconds timeout
+                navigated = time.monotonic()
 
-                # Scroll the page
-                page.mouse.wheel(0, 15000)
+                # Scroll the page so lazy content starts loading, then wait for it to settle
+                page.mouse.wheel(0, self.scroll_distance)
+                readiness = wait_until_ready(page, self.readiness)
+                ready = time.monotonic()
 
                 if self.mode != "tool_mode":
                     self.get_links(page)
@@ -69,12 +229,8 @@ class WebCrawler:
                 # Save the page content and screenshot
 
                 self.file_utils.write_file(self.file_utils.html_path, page.content())
-                page.screenshot(path=self.file_utils.screenshot_path, full_page=True)
-
-                # Wait for any final processing
-                time.sleep(10)
-                if self.llm_id in anthropic_supported_models:
-                    self.compress_image()
+                self.keep_screenshot(ImageArtifact(page.screenshot(full_page=True)))
+                self._record_timings(site_url, started, navigated, ready, readiness)
             except Exception as e:
                 print(f"Error during browsing: {str(e)}")
                 raise e
@@ -1,12 +1,15 @@
 import os
+from typing import Iterable, Optional
 from langchain_core.language_models.llms import LLM
+from utils.artifacts import ImageArtifact
+from utils.scratchpad_store import ScratchpadStore
 
 
 class FileUtils:
 
     def __init__(self, tmp_folder):
         self.tmp_folder = tmp_folder
-        self.agent_scratchpad_path = os.path.join(tmp_folder, "scratchpad.txt")
+        self.agent_scratchpad_path = os.path.join(tmp_folder, "scratchpad.sqlite")
         self.python_file_path = os.path.join(tmp_folder, "python_code.py")
         self.test_log_path = os.path.join(tmp_folder, "test.log")
         self.screenshot_path = os.path.join(tmp_folder, "tmp.png")
@@ -14,6 +17,9 @@ class FileUtils:
         self.feed_back_file_path = os.path.join(tmp_folder, "feedback.txt")
         self.links_to_parse_json_path = os.path.join(tmp_folder, "links.json")
         self.agent_scratchpad_seperator = ""
+        self._scratchpad: Optional[ScratchpadStore] = None
+        # Set by the crawl that captured screenshot_path, so tools use the bytes already in memory
+        self.screenshot: Optional[ImageArtifact] = None
 
     def set_seperator(self, tool_name):
         self.agent_scratchpad_seperator = f'''{tool_name}: =================================='''
@@ -41,13 +47,33 @@ class FileUtils:
         txt = self.common_utils(file_path, "r")
         return llm.invoke(query + "\n" + txt).content
 
-    def append_to_agent_scratchpad(self, txt, tool_name):
+    def load_screenshot(self) -> Optional[ImageArtifact]:
+        """Screenshot of the current page, read from disk only when no crawl handed it over"""
+        if self.screenshot is None and os.path.exists(self.screenshot_path):
+            self.screenshot = ImageArtifact.from_file(self.screenshot_path)
+        return self.screenshot
+
+    @property
+    def scratchpad(self) -> ScratchpadStore:
+        """Structured scratchpad of the run owning this folder, opened on first use"""
+        if self._scratchpad is None:
+            self._scratchpad = ScratchpadStore(self.agent_scratchpad_path, os.path.basename(self.tmp_folder))
+        return self._scratchpad
+
+    def close(self):
+        if self._scratchpad is not None:
+            self._scratchpad.close()
+            self._scratchpad = None
+
+    def append_to_agent_scratchpad(self, txt, tool_name, section=None, kind="observation"):
         self.set_seperator(tool_name)
-        self.append_file(self.agent_scratchpad_path, self.agent_scratchpad_seperator + "\n" + txt + "\n")
+        self.scratchpad.append(tool_name, txt, section, kind)
 
-    def read_from_agent_scratchpad(self):
-        return self.read_file(self.agent_scratchpad_path)
+    def read_from_agent_scratchpad(self, sections: Optional[Iterable[str]] = None,
+                                   tools: Optional[Iterable[str]] = None, kinds: Optional[Iterable[str]] = None):
+        """Scratchpad text limited to the sections, tools and kinds asked for, everything by default"""
+        return self.scratchpad.render(sections=sections, tools=tools, kinds=kinds)
 
     def read_logs_append_to_agent_scratchpad(self):
         txt = self.read_file(self.test_log_path)
-        self.append_to_agent_scratchpad("test_logs: \n"+ txt, "logs added")
\ No newline at end of file
+        self.append_to_agent_scratchpad("test_logs: \n"+ txt, "logs added", kind="log")
\ No newline at end of file
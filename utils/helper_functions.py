@@ -3,6 +3,8 @@ from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
 from typing import List
 from utils.file_utils import FileUtils
+from utils.html_extractor import extract_semantic_regions_from_file
+from utils.token_counter import count_document_tokens
 
 
 class HelperFunct(FileUtils):
@@ -15,20 +17,25 @@ class HelperFunct(FileUtils):
         with open(image_path, "rb") as image_file:
             return base64.b64encode(image_file.read()).decode("utf-8")
 
-    def create_chunks(self):
-        fp = open(self.html_path, "r")
-        txt = fp.read()
+    def create_chunks(self, chunk_size=5000):
+        # Scripts, styles and markup are stripped before tokenizing, only user-facing content is chunked.
+        # Header, nav, footer and consent banners get chunks of their own, after the page content, so the
+        # copies repeated on every page of a site can be recognized and mapped once
+        regions = extract_semantic_regions_from_file(self.html_path)
+        content = regions.pop("content", "")
         text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
-            chunk_size=5000,
+            chunk_size=chunk_size,
             chunk_overlap=20,
             is_separator_regex=False,
         )
 
-        chunks = text_splitter.create_documents([txt])
+        chunks = text_splitter.create_documents(
+            [content, *regions.values()],
+            [{"region": "content"}, *({"region": region} for region in regions)],
+        )
         return chunks
 
     @staticmethod
-    def length_function(documents: List[Document]) -> int:
+    def length_function(documents: List[Document], llm_id: str = "gpt-4o") -> int:
         """Get number of tokens for input contents."""
-        # return sum(llm.get_num_tokens(doc.page_content) for doc in documents)
-        return sum(100 for doc in documents)
+        return count_document_tokens(documents, llm_id)
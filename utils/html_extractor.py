@@ -0,0 +1,227 @@
+import re
+from html.parser import HTMLParser
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+# Content of these elements never reaches the model
+SKIP_TAGS = {"script", "style", "noscript", "svg", "template", "iframe", "canvas", "object"}
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source",
+             "track", "wbr"}
+# Elements whose text becomes one labelled line
+CAPTURE_TAGS = {"title": "title", "h1": "h1", "h2": "h2", "h3": "h3", "h4": "h4", "h5": "h5", "h6": "h6",
+                "a": "link", "button": "button", "label": "label", "select": "select", "textarea": "textarea",
+                "summary": "summary"}
+# Elements that end a run of free text
+BLOCK_TAGS = {"html", "body", "header", "footer", "main", "nav", "aside", "section", "article", "div", "p", "ul",
+              "ol", "li", "table", "tr", "td", "th", "blockquote", "figure", "figcaption", "dl", "dt", "dd", "pre",
+              "form", "fieldset", "details"}
+IMPLICITLY_CLOSED = {"p", "li", "dt", "dd", "tr", "td", "th", "option"}
+WHITESPACE = re.compile(r"\s+")
+
+# Page regions: site-wide chrome repeats on every page of a site, "content" is what the page is about
+LANDMARK_TAGS = {"header": "header", "nav": "nav", "footer": "footer", "aside": "aside"}
+LANDMARK_ROLES = {"banner": "header", "navigation": "nav", "contentinfo": "footer", "complementary": "aside"}
+CONSENT = re.compile(r"cookie|consent|gdpr", re.IGNORECASE)
+BOILERPLATE_REGIONS = {"header", "nav", "footer", "aside", "consent"}
+
+
+class SemanticExtractor(HTMLParser):
+    """Streaming HTML parser that keeps only user-facing content, one compact line per element:
+
+        body>main>section#pricing | h2: Plans for every team
+        body>header>nav | link: Pricing -> /pricing
+        body>main>form#signup | input(type=email, name=email, placeholder=Work email)
+    """
+
+    def __init__(self, path_depth: int = 4, max_text: int = 300):
+        super().__init__(convert_charrefs=True)
+        self.path_depth = path_depth
+        self.max_text = max_text
+        self.stack: List[List[str]] = []
+        self.captures: List[list] = []
+        self.block: List[str] = []
+        self.skip_depth = 0
+        self.lines: List[str] = []
+        self.regions: List[str] = []
+        self._last_line = None
+
+    def path(self) -> str:
+        return ">".join(label for tag, label, _ in self.stack[-self.path_depth:] if tag != "html")
+
+    def region(self) -> str:
+        return self.stack[-1][2] if self.stack else "content"
+
+    @staticmethod
+    def region_for(tag: str, attrs: Dict[str, str], parent: str) -> str:
+        """Region of an element: the outermost landmark around it, main content shields its own headers"""
+        if parent != "content":
+            return parent
+        if tag in ("main", "article") or attrs.get("role") == "main":
+            return "main"
+        if CONSENT.search(f"{attrs.get('id', '')} {attrs.get('class', '')}"):
+            return "consent"
+        return LANDMARK_TAGS.get(tag) or LANDMARK_ROLES.get(attrs.get("role", ""), parent)
+
+    def emit(self, kind: str, text: str = "", path: Optional[str] = None, region: Optional[str] = None):
+        text = WHITESPACE.sub(" ", text).strip()
+        if len(text) > self.max_text:
+            text = text[:self.max_text] + "..."
+        line = f"{path if path is not None else self.path()} | {kind}" + (f": {text}" if text else "")
+        if line != self._last_line:
+            self.lines.append(line)
+            self.regions.append(region or self.region())
+            self._last_line = line
+
+    def flush_block(self):
+        text = " ".join(self.block)
+        self.block = []
+        if text.strip():
+            self.emit("text", text)
+
+    @staticmethod
+    def describe(tag: str, attrs: Dict[str, str], names) -> str:
+        details = ", ".join(f"{name}={attrs[name]}" for name in names if attrs.get(name))
+        return f"{tag}({details})" if details else tag
+
+    def handle_starttag(self, tag, attrs):
+        if self.skip_depth:
+            if tag not in VOID_TAGS:
+                self.skip_depth += 1
+            return
+        if tag in SKIP_TAGS:
+            self.skip_depth = 1
+            return
+        attrs = {name: value or "" for name, value in attrs}
+
+        if tag in VOID_TAGS:
+            self.handle_void(tag, attrs)
+            return
+        if tag in IMPLICITLY_CLOSED and self.stack and self.stack[-1][0] == tag:
+            self.close_top()
+        if tag in BLOCK_TAGS:
+            self.flush_block()
+
+        self.stack.append([tag, f"{tag}#{attrs['id']}" if attrs.get("id") else tag,
+                           self.region_for(tag, attrs, self.region())])
+        if tag in CAPTURE_TAGS:
+            self.captures.append([tag, attrs, self.path(), [], self.region()])
+        elif tag == "form":
+            self.emit(self.describe("form", attrs, ("action", "method")))
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS:
+            self.handle_endtag(tag)
+
+    def handle_void(self, tag: str, attrs: Dict[str, str]):
+        if tag == "input" and attrs.get("type", "text") not in ("hidden",):
+            self.emit(self.describe("input", attrs, ("type", "name", "placeholder", "value", "aria-label")))
+        elif tag == "img" and attrs.get("alt", "").strip():
+            self.emit("image", attrs["alt"])
+        elif tag == "meta" and attrs.get("name", "").lower() == "description":
+            self.emit("description", attrs.get("content", ""))
+
+    def handle_endtag(self, tag):
+        if self.skip_depth:
+            self.skip_depth -= 1
+            return
+        if not any(open_tag == tag for open_tag, _, _ in self.stack):
+            return
+        while self.stack:
+            closed = self.stack[-1][0]
+            self.close_top()
+            if closed == tag:
+                break
+
+    def close_top(self):
+        tag = self.stack[-1][0]
+        if tag in CAPTURE_TAGS and self.captures and self.captures[-1][0] == tag:
+            _, attrs, path, parts, region = self.captures.pop()
+            text = " ".join(parts)
+            if self.captures:
+                # Nested captures (a link inside a heading) also feed their parent
+                self.captures[-1][3].append(text)
+            kind = CAPTURE_TAGS[tag]
+            if tag == "a":
+                href = attrs.get("href", "")
+                if text.strip() or attrs.get("aria-label"):
+                    label = text if text.strip() else attrs["aria-label"]
+                    href = "" if href.startswith("javascript:") else href
+                    self.emit(kind, f"{label} -> {href}" if href else label, path, region)
+            elif tag in ("select", "textarea"):
+                self.emit(self.describe(kind, attrs, ("name",)), text, path, region)
+            elif text.strip():
+                self.emit(kind, text, path, region)
+        if tag in BLOCK_TAGS:
+            self.flush_block()
+        self.stack.pop()
+
+    def handle_data(self, data):
+        if self.skip_depth or not data.strip():
+            return
+        if self.captures:
+            self.captures[-1][3].append(data)
+        else:
+            self.block.append(data)
+
+    def close(self):
+        super().close()
+        while self.stack:
+            self.close_top()
+        self.flush_block()
+
+    def drain(self) -> List[str]:
+        """Return the lines completed so far and forget them"""
+        return [line for _, line in self.drain_regions()]
+
+    def drain_regions(self) -> List[Tuple[str, str]]:
+        """Return the lines completed so far with the page region each belongs to, and forget them"""
+        pairs = list(zip(self.regions, self.lines))
+        self.lines, self.regions = [], []
+        return pairs
+
+
+def iter_semantic_regions(html_parts: Iterable[str], **kwargs) -> Iterator[Tuple[str, str]]:
+    """Feed HTML incrementally and yield (region, line) as soon as each element is complete"""
+    extractor = SemanticExtractor(**kwargs)
+    for part in html_parts:
+        extractor.feed(part)
+        yield from extractor.drain_regions()
+    extractor.close()
+    yield from extractor.drain_regions()
+
+
+def iter_semantic_lines(html_parts: Iterable[str], **kwargs) -> Iterator[str]:
+    for _, line in iter_semantic_regions(html_parts, **kwargs):
+        yield line
+
+
+def group_regions(pairs: Iterable[Tuple[str, str]]) -> Dict[str, List[str]]:
+    """Lines per region in order of first appearance, main and unmarked lines together as content"""
+    grouped: Dict[str, List[str]] = {}
+    for region, line in pairs:
+        grouped.setdefault(region if region in BOILERPLATE_REGIONS else "content", []).append(line)
+    return grouped
+
+
+def _read_blocks(path: str, block_size: int) -> Iterator[str]:
+    with open(path, "r", errors="replace") as fp:
+        while True:
+            block = fp.read(block_size)
+            if not block:
+                return
+            yield block
+
+
+def extract_semantic_text(html: str, **kwargs) -> str:
+    return "\n".join(iter_semantic_lines([html], **kwargs))
+
+
+def extract_semantic_text_from_file(path: str, block_size: int = 1 << 16, **kwargs) -> str:
+    return "\n".join(iter_semantic_lines(_read_blocks(path, block_size), **kwargs))
+
+
+def extract_semantic_regions_from_file(path: str, block_size: int = 1 << 16, **kwargs) -> Dict[str, str]:
+    """Semantic text of a saved page split into content and boilerplate regions"""
+    grouped = group_regions(iter_semantic_regions(_read_blocks(path, block_size), **kwargs))
+    return {region: "\n".join(lines) for region, lines in grouped.items()}
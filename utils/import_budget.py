@@ -0,0 +1,77 @@
+"""Import-time budget report.
+
+Imports each target module in a fresh interpreter with ``-X importtime`` and
+reports the per-module timings, so startup regressions can be tracked:
+
+    python -m utils.import_budget hemden utils.tools --budget-ms 1500 --json import_budget.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from typing import Any, Dict, List
+
+DEFAULT_TARGETS = ["hemden", "utils.tools"]
+
+
+def measure(module: str) -> Dict[str, Any]:
+    """Import one module in a subprocess and parse the importtime trace"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    )
+    timings = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        timings.append({
+            "module": name.strip(),
+            "self_ms": int(self_us) / 1000,
+            "cumulative_ms": int(cumulative_us) / 1000,
+        })
+
+    total = next((t["cumulative_ms"] for t in timings if t["module"] == module), None)
+    return {
+        "target": module,
+        "ok": result.returncode == 0,
+        "error": result.stderr.strip().splitlines()[-1] if result.returncode else None,
+        "total_ms": total,
+        "modules": sorted(timings, key=lambda t: t["self_ms"], reverse=True),
+    }
+
+
+def print_report(reports: List[Dict[str, Any]], top: int, budget_ms: float = None):
+    for report in reports:
+        status = "FAILED" if not report["ok"] else f"{report['total_ms']:.1f} ms"
+        over = budget_ms is not None and report["ok"] and report["total_ms"] > budget_ms
+        print(f"{report['target']}: {status}{' (over budget)' if over else ''}")
+        if report["error"]:
+            print(f"    {report['error']}")
+        for timing in report["modules"][:top]:
+            print(f"    {timing['self_ms']:9.1f} ms self  {timing['cumulative_ms']:9.1f} ms cumulative  {timing['module']}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Report per-module import times against a startup budget")
+    parser.add_argument("targets", nargs="*", default=DEFAULT_TARGETS)
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("import_budget_ms", 0)) or None)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--json", dest="json_path")
+    args = parser.parse_args(argv)
+
+    reports = [measure(target) for target in args.targets]
+    print_report(reports, args.top, args.budget_ms)
+
+    if args.json_path:
+        with open(args.json_path, "w") as fp:
+            json.dump({"budget_ms": args.budget_ms, "reports": reports}, fp, indent=2)
+
+    failed = [r for r in reports if not r["ok"]]
+    over_budget = [r for r in reports if args.budget_ms and r["ok"] and r["total_ms"] > args.budget_ms]
+    return 1 if failed or over_budget else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
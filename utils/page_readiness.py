@@ -0,0 +1,72 @@
+import os
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, Optional
+
+
+@dataclass
+class ReadinessConfig:
+    """How long the page must stay quiet before capture, and the hard cap on the whole wait"""
+    quiescence_ms: int = int(os.getenv("readiness_quiescence_ms", 500))
+    hard_cap_ms: int = int(os.getenv("readiness_hard_cap_ms", 15000))
+    poll_ms: int = int(os.getenv("readiness_poll_ms", 100))
+
+
+# Runs inside the page: waits for DOM, fonts, images and a quiet layout, and reports where the time went
+READINESS_SCRIPT = '''async ({quiescence_ms, hard_cap_ms, poll_ms}) => {
+    const start = performance.now();
+    const deadline = start + hard_cap_ms;
+    const remaining = () => Math.max(0, deadline - performance.now());
+    const capped = (promise) => Promise.race([promise, new Promise(r => setTimeout(r, remaining()))]);
+    const timings = {};
+
+    let t = performance.now();
+    if (document.readyState === 'loading') {
+        await capped(new Promise(r => document.addEventListener('DOMContentLoaded', r, {once: true})));
+    }
+    timings.dom_ms = performance.now() - t;
+
+    t = performance.now();
+    if (document.fonts && document.fonts.ready) {
+        await capped(document.fonts.ready);
+    }
+    timings.fonts_ms = performance.now() - t;
+
+    t = performance.now();
+    const pending = Array.from(document.images).filter(img => !img.complete).map(img => new Promise(r => {
+        img.addEventListener('load', r, {once: true});
+        img.addEventListener('error', r, {once: true});
+    }));
+    await capped(Promise.all(pending));
+    timings.images_ms = performance.now() - t;
+    timings.pending_images = Array.from(document.images).filter(img => !img.complete).length;
+
+    t = performance.now();
+    let lastChange = performance.now();
+    let lastHeight = document.documentElement.scrollHeight;
+    const observer = new MutationObserver(() => { lastChange = performance.now(); });
+    observer.observe(document.documentElement, {childList: true, subtree: true, characterData: true});
+    while (performance.now() - lastChange < quiescence_ms && remaining() > 0) {
+        await new Promise(r => setTimeout(r, poll_ms));
+        const height = document.documentElement.scrollHeight;
+        if (height !== lastHeight) {
+            lastHeight = height;
+            lastChange = performance.now();
+        }
+    }
+    observer.disconnect();
+    timings.layout_ms = performance.now() - t;
+
+    timings.total_ms = performance.now() - start;
+    timings.timed_out = remaining() <= 0;
+    return timings;
+}'''
+
+
+def wait_until_ready(page, config: Optional[ReadinessConfig] = None) -> Dict[str, Any]:
+    """Block until a sync Playwright page has settled, returns the per-phase timings"""
+    return page.evaluate(READINESS_SCRIPT, asdict(config or ReadinessConfig()))
+
+
+async def await_ready(page, config: Optional[ReadinessConfig] = None) -> Dict[str, Any]:
+    """Wait until an async Playwright page has settled, returns the per-phase timings"""
+    return await page.evaluate(READINESS_SCRIPT, asdict(config or ReadinessConfig()))
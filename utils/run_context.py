@@ -0,0 +1,85 @@
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Optional
+
+from persona.persona_store import persona_store
+from prompts.prompt_injection import PromptInjection
+from utils.scratchpad_beautifier import ScratchpadBeautify
+from handlers.handle_long_context import EnhancedLongContextHandler
+from utils.chunk_dedup import chunk_dedup
+from utils.token_counter import TokenBudget
+from utils.workspaces import workspace_manager
+
+
+_current_run: ContextVar[Optional["RunContext"]] = ContextVar("stella_run_context", default=None)
+
+
+@dataclass
+class RunContext:
+    """Everything a single agent run needs: persona, model, workspace and handlers"""
+    persona_id: str
+    llm_id: str
+    workspace: str
+    prompt: PromptInjection
+    beau: ScratchpadBeautify
+    lch: EnhancedLongContextHandler
+    token_budget: TokenBudget
+    crawl_mode: Optional[str] = None
+    run_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    # Runs evaluating pages of one site share a site run, a standalone run is its own
+    site_run: Optional[str] = None
+
+    @property
+    def persona(self):
+        return self.prompt.persona
+
+    @classmethod
+    def create(cls, persona_id: str, llm_id: str, tmp_folder: Optional[str] = None,
+               crawl_mode: Optional[str] = None, run_id: Optional[str] = None,
+               site_run: Optional[str] = None) -> "RunContext":
+        """Build a context with its own workspace folder under tmp_folder/runs"""
+        run_id = run_id or uuid.uuid4().hex
+        workspace = workspace_manager.create(run_id, tmp_folder)
+
+        bundle = persona_store.get(persona_id)
+        token_budget = TokenBudget()
+        lch = EnhancedLongContextHandler(workspace, bundle.prompt, bundle.beau,
+                                         bundle.map_prompt, bundle.reduce_prompt, token_budget,
+                                         persona_key=f"{persona_id}:{bundle.version}", graph=bundle.graph)
+        lch.site_run = site_run or run_id
+        return cls(persona_id=persona_id, llm_id=llm_id, workspace=workspace, prompt=bundle.prompt,
+                   beau=bundle.beau, lch=lch, token_budget=token_budget, crawl_mode=crawl_mode, run_id=run_id,
+                   site_run=lch.site_run)
+
+    @property
+    def config(self):
+        """Runnable config for the agent execution, wires token accounting into every LLM call of the run"""
+        return {"callbacks": [self.token_budget.callback], "metadata": {"run_id": self.run_id}}
+
+    @contextmanager
+    def activate(self):
+        """Make this context visible to the tools invoked inside the block, the workspace is released after it"""
+        token = _current_run.set(self)
+        try:
+            yield self
+        finally:
+            _current_run.reset(token)
+            if self.lch.stream is not None:
+                # Map calls of a crawl nobody collected must not outlive the run
+                self.lch.stream.cancel()
+                self.lch.stream = None
+            self.lch.close()
+            workspace_manager.release(self.run_id)
+            if self.site_run == self.run_id:
+                # A standalone run owns its dedup index, shared site runs are dropped by whoever started them
+                chunk_dedup.drop(self.site_run)
+
+
+def get_run_context() -> RunContext:
+    """Return the context of the run the caller belongs to"""
+    ctx = _current_run.get()
+    if ctx is None:
+        raise RuntimeError("No active run context, wrap the agent execution in RunContext.activate()")
+    return ctx
@@ -0,0 +1,112 @@
+import asyncio
+import hashlib
+import logging
+import os
+from typing import Iterable, List, Optional
+
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+
+from chains.map_chain import MapChain
+from llms.rate_limiter import rate_limiters
+from prompts.scratchpad import compaction_template
+from utils.const import model_context_windows
+from utils.scratchpad_store import ScratchpadEntry, ScratchpadStore
+from utils.token_counter import count_tokens
+
+
+class ScratchpadCompactor:
+    """Keeps the scratchpad pasted into a prompt under a token threshold.
+
+    Below the threshold entries are returned raw. Above it the newest entries stay raw up to
+    recent_tokens and older entries are summarized per section, in groups of group_tokens, the
+    summaries being summarized again until the section fits its share of the threshold.
+    Summaries are cached in the run's store by the text they cover, so later calls only
+    summarize what was appended since.
+    """
+
+    max_levels = 4
+
+    def __init__(self, store: ScratchpadStore, llm_id: str,
+                 max_tokens: Optional[int] = None, recent_tokens: Optional[int] = None,
+                 group_tokens: Optional[int] = None):
+        max_tokens = int(os.getenv("scratchpad_max_tokens", 12000)) if max_tokens is None else max_tokens
+        recent_tokens = int(os.getenv("scratchpad_recent_tokens", 4000)) if recent_tokens is None else recent_tokens
+        group_tokens = int(os.getenv("scratchpad_group_tokens", 4000)) if group_tokens is None else group_tokens
+        self.store = store
+        self.llm_id = llm_id
+        # Never more than half of the prompt model's context, the rest is instructions and completion
+        self.max_tokens = min(max_tokens, model_context_windows.get(llm_id, 128000) // 2)
+        self.recent_tokens = min(recent_tokens, self.max_tokens // 2)
+        self.group_tokens = group_tokens
+        self.logger = logging.getLogger(__name__)
+        self.summarized = 0
+        self.cached = 0
+
+    def tokens(self, text: str) -> int:
+        return count_tokens(text, self.llm_id)
+
+    async def arender(self, sections: Optional[Iterable[str]] = None, tools: Optional[Iterable[str]] = None,
+                      kinds: Optional[Iterable[str]] = None, config=None) -> str:
+        entries = self.store.entries(sections=sections, tools=tools, kinds=kinds)
+        texts = [entry.render() for entry in entries]
+        sizes = [self.tokens(text) for text in texts]
+        if sum(sizes) <= self.max_tokens:
+            return "".join(texts)
+
+        # Newest entries stay raw while they fit in recent_tokens
+        split, recent = len(entries), 0
+        while split and recent + sizes[split - 1] <= self.recent_tokens:
+            split -= 1
+            recent += sizes[split]
+
+        older: dict = {}
+        for entry in entries[:split]:
+            older.setdefault(entry.section, []).append(entry)
+        budget = max(256, (self.max_tokens - recent) // max(1, len(older)))
+        compacted = await asyncio.gather(*(self.compact_section(section, section_entries, budget, config)
+                                           for section, section_entries in older.items()))
+
+        self.logger.info(f"Scratchpad compacted from {sum(sizes)} tokens: {split} older entries in "
+                         f"{len(older)} sections summarized ({self.summarized} calls, {self.cached} cached), "
+                         f"{len(entries) - split} kept raw")
+        header = [f"{section} (earlier notes, summarized): ==================================\n{text}\n"
+                  for section, text in zip(older, compacted)]
+        return "".join(header + texts[split:])
+
+    def group(self, texts: List[str]) -> List[List[str]]:
+        """Consecutive texts in groups of up to group_tokens, stable as new texts are appended"""
+        groups, size = [], 0
+        for text in texts:
+            tokens = self.tokens(text)
+            if not groups or size + tokens > self.group_tokens:
+                groups.append([])
+                size = 0
+            groups[-1].append(text)
+            size += tokens
+        return groups
+
+    async def compact_section(self, section: str, entries: List[ScratchpadEntry], budget: int, config=None) -> str:
+        texts = [entry.render() for entry in entries]
+        for level in range(self.max_levels):
+            if sum(self.tokens(text) for text in texts) <= budget:
+                break
+            texts = list(await asyncio.gather(*(self.summarize(section, level, group, config)
+                                                for group in self.group(texts))))
+        return "\n".join(texts)
+
+    async def summarize(self, section: str, level: int, texts: List[str], config=None) -> str:
+        notes = "\n".join(texts)
+        key = hashlib.sha256("\0".join((MapChain.llm_id, section, str(level), notes)).encode("utf-8")).hexdigest()
+        summary = self.store.summary(key)
+        if summary is not None:
+            self.cached += 1
+            return summary
+
+        chain = ChatPromptTemplate([("human", compaction_template)]) | MapChain.selected_llm() | StrOutputParser()
+        summary = await rate_limiters.get(MapChain.llm_id).run(
+            lambda: chain.ainvoke({"section": section, "notes": notes}, config=config),
+            count_tokens(notes, MapChain.llm_id))
+        self.store.save_summary(key, summary)
+        self.summarized += 1
+        return summary
@@ -0,0 +1,107 @@
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Iterable, List, Optional
+
+# Section each tool's entries belong to, consumers read sections rather than the whole history
+TOOL_SECTIONS = {
+    "crawl": "crawl",
+    "query_text_visually": "visual",
+    "query_site_textually": "textual",
+    "query_text_textually": "textual",
+    "analyze_heatmap": "heatmap",
+    "generate_python_code": "code",
+    "run_python_code": "tests",
+    "logs added": "tests",
+}
+# What the site looks like to the persona, without generated code or test output
+OBSERVATION_SECTIONS = ("crawl", "visual", "textual", "heatmap")
+
+
+@dataclass
+class ScratchpadEntry:
+    id: int
+    run_id: str
+    section: str
+    tool: str
+    kind: str
+    created_at: float
+    content: str
+
+    def render(self) -> str:
+        """Same layout as the former scratchpad.txt"""
+        return f"{self.tool}: ==================================\n{self.content}\n"
+
+
+class ScratchpadStore:
+    """Append-only SQLite record store of a run's scratchpad, indexed by section and tool"""
+
+    def __init__(self, path: str, run_id: str):
+        self.path = path
+        self.run_id = run_id
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS entries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            run_id TEXT NOT NULL,
+            section TEXT NOT NULL,
+            tool TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            content TEXT NOT NULL)""")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS entries_section ON entries (run_id, section, id)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS entries_tool ON entries (run_id, tool, id)")
+        # Summaries of older entries, keyed by the content they summarize, see utils.scratchpad_compactor
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS summaries (
+            key TEXT PRIMARY KEY,
+            created_at REAL NOT NULL,
+            content TEXT NOT NULL)""")
+        self.connection.commit()
+
+    def append(self, tool: str, content: str, section: Optional[str] = None, kind: str = "observation") -> int:
+        with self._lock:
+            cursor = self.connection.execute(
+                "INSERT INTO entries (run_id, section, tool, kind, created_at, content) VALUES (?, ?, ?, ?, ?, ?)",
+                (self.run_id, section or TOOL_SECTIONS.get(tool, tool), tool, kind, time.time(), str(content)))
+            self.connection.commit()
+            return cursor.lastrowid
+
+    @staticmethod
+    def _in(column: str, values: Optional[Iterable[str]], clauses: List[str], params: list):
+        if values is not None:
+            values = list(values)
+            clauses.append(f"{column} IN ({', '.join('?' * len(values))})" if values else "0")
+            params.extend(values)
+
+    def entries(self, sections: Optional[Iterable[str]] = None, tools: Optional[Iterable[str]] = None,
+                kinds: Optional[Iterable[str]] = None, after_id: int = 0) -> List[ScratchpadEntry]:
+        """Entries of this run in write order, only from the requested sections, tools and kinds"""
+        clauses, params = ["run_id = ?", "id > ?"], [self.run_id, after_id]
+        self._in("section", sections, clauses, params)
+        self._in("tool", tools, clauses, params)
+        self._in("kind", kinds, clauses, params)
+        with self._lock:
+            rows = self.connection.execute(
+                f"SELECT id, run_id, section, tool, kind, created_at, content FROM entries "
+                f"WHERE {' AND '.join(clauses)} ORDER BY id", params).fetchall()
+        return [ScratchpadEntry(*row) for row in rows]
+
+    def render(self, **filters) -> str:
+        return "".join(entry.render() for entry in self.entries(**filters))
+
+    def summary(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self.connection.execute("SELECT content FROM summaries WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def save_summary(self, key: str, content: str):
+        with self._lock:
+            self.connection.execute("INSERT OR REPLACE INTO summaries (key, created_at, content) VALUES (?, ?, ?)",
+                                    (key, time.time(), content))
+            self.connection.commit()
+
+    def close(self):
+        with self._lock:
+            self.connection.close()
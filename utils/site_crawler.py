@@ -0,0 +1,157 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+from urllib.parse import parse_qsl, urlencode, urljoin, urlparse, urlunparse
+
+from utils.browser_pool import get_browser_pool
+from utils.crawl_website import LINKS_SCRIPT
+
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+TRACKING_PARAMS = ("utm_", "gclid", "fbclid", "mc_cid", "mc_eid")
+
+
+def normalize_url(url: str, base: Optional[str] = None) -> Optional[str]:
+    """Canonical form used for dedupe: absolute http(s), lowercase host, no fragment, default port or tracking params"""
+    if not url:
+        return None
+    parsed = urlparse(urljoin(base, url.strip()) if base else url.strip())
+    if parsed.scheme not in DEFAULT_PORTS or not parsed.hostname:
+        return None
+
+    netloc = parsed.hostname.lower()
+    if parsed.port and parsed.port != DEFAULT_PORTS[parsed.scheme]:
+        netloc = f"{netloc}:{parsed.port}"
+    path = parsed.path or "/"
+    if path != "/" and path.endswith("/"):
+        path = path.rstrip("/")
+    query = urlencode(sorted((k, v) for k, v in parse_qsl(parsed.query, keep_blank_values=True)
+                             if not k.lower().startswith(TRACKING_PARAMS)))
+    return urlunparse((parsed.scheme.lower(), netloc, path, "", query, ""))
+
+
+def site_key(url: str) -> str:
+    """Host without a leading www., so both variants count as the same site"""
+    host = urlparse(url).hostname or ""
+    return host[4:] if host.startswith("www.") else host
+
+
+def default_priority(url: str, depth: int) -> float:
+    """Shallow pages first, short paths before long ones, product detail pages last"""
+    path = urlparse(url).path
+    priority = depth * 10 + path.count("/")
+    if "/product/" in path:
+        priority += 5
+    return priority
+
+
+@dataclass
+class CrawlConfig:
+    max_depth: int = int(os.getenv("site_max_depth", 2))
+    max_pages: int = int(os.getenv("site_max_pages", 20))
+    concurrency: int = int(os.getenv("site_crawl_concurrency", 4))
+    per_host_concurrency: int = int(os.getenv("site_per_host_concurrency", 2))
+    same_domain: bool = True
+    timeout_ms: int = 30000
+
+
+@dataclass(order=True)
+class FrontierItem:
+    priority: float
+    seq: int
+    url: str = field(compare=False)
+    depth: int = field(compare=False)
+
+
+class Frontier:
+    """Priority queue of urls to visit that never yields the same normalized url twice"""
+
+    def __init__(self):
+        self._heap: List[FrontierItem] = []
+        self._seen = set()
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def push(self, url: str, depth: int, priority: float) -> bool:
+        if url in self._seen:
+            return False
+        self._seen.add(url)
+        heapq.heappush(self._heap, FrontierItem(priority, next(self._seq), url, depth))
+        return True
+
+    def pop(self) -> FrontierItem:
+        return heapq.heappop(self._heap)
+
+
+class SiteCrawler:
+    """Discovers the pages of a site in parallel using the shared browser pool"""
+
+    def __init__(self, start_url: str, config: Optional[CrawlConfig] = None,
+                 priority: Callable[[str, int], float] = default_priority):
+        self.start_url = normalize_url(start_url)
+        if self.start_url is None:
+            raise ValueError(f"Not an http(s) url: {start_url}")
+        self.config = config or CrawlConfig()
+        self.priority = priority
+        self.logger = logging.getLogger(__name__)
+        self.frontier = Frontier()
+        self.visited: List[str] = []
+        self.failed: Dict[str, str] = {}
+        self._host_slots: Dict[str, asyncio.Semaphore] = {}
+        self._in_flight = 0
+        self._cond: Optional[asyncio.Condition] = None
+
+    def allowed(self, url: str) -> bool:
+        return not self.config.same_domain or site_key(url) == site_key(self.start_url)
+
+    async def crawl(self) -> List[str]:
+        """Return the discovered page urls in visit (priority) order, start url first"""
+        self._cond = asyncio.Condition()
+        self.frontier.push(self.start_url, 0, self.priority(self.start_url, 0))
+        workers = [asyncio.create_task(self._worker()) for _ in range(self.config.concurrency)]
+        await asyncio.gather(*workers)
+        self.logger.info(f"Discovered {len(self.visited)} pages on {self.start_url} ({len(self.failed)} failed)")
+        return list(self.visited)
+
+    async def _worker(self):
+        while True:
+            async with self._cond:
+                while not self.frontier and self._in_flight:
+                    await self._cond.wait()
+                if not self.frontier or len(self.visited) >= self.config.max_pages:
+                    self._cond.notify_all()
+                    return
+                item = self.frontier.pop()
+                self.visited.append(item.url)
+                self._in_flight += 1
+
+            links = []
+            if item.depth < self.config.max_depth:
+                try:
+                    links = await self._fetch_links(item.url)
+                except Exception as e:
+                    self.logger.warning(f"Failed to fetch links from {item.url}: {str(e)}")
+                    self.failed[item.url] = str(e)
+
+            async with self._cond:
+                for link in links:
+                    url = normalize_url(link, item.url)
+                    if url and self.allowed(url):
+                        self.frontier.push(url, item.depth + 1, self.priority(url, item.depth + 1))
+                self._in_flight -= 1
+                self._cond.notify_all()
+
+    async def _fetch_links(self, url: str) -> List[str]:
+        host = urlparse(url).netloc
+        slots = self._host_slots.setdefault(host, asyncio.Semaphore(self.config.per_host_concurrency))
+        pool = await get_browser_pool()
+        async with slots, pool.context() as context:
+            page = await context.new_page()
+            await page.goto(url, wait_until="domcontentloaded", timeout=self.config.timeout_ms)
+            return await page.evaluate(LINKS_SCRIPT)
@@ -0,0 +1,155 @@
+import os
+import threading
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+import tiktoken
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.documents import Document
+from langchain_core.outputs import LLMResult
+
+from utils.const import model_tokenizers, model_context_windows
+
+
+@lru_cache(maxsize=None)
+def get_encoding(llm_id: str) -> tiktoken.Encoding:
+    """Tokenizer for a model, loaded once per process"""
+    return tiktoken.get_encoding(model_tokenizers.get(llm_id, "o200k_base"))
+
+
+@lru_cache(maxsize=8192)
+def count_tokens(text: str, llm_id: str) -> int:
+    """Number of tokens in text for the given model, memoized for repeated chunks and summaries"""
+    return len(get_encoding(llm_id).encode(text, disallowed_special=()))
+
+
+def count_document_tokens(documents: List[Document], llm_id: str) -> int:
+    return sum(count_tokens(doc.page_content, llm_id) for doc in documents)
+
+
+class TokenBudget:
+    """Run-wide token accounting: usage per tool, plus chunk and collapse sizes derived from real model limits"""
+
+    def __init__(self, max_tokens: Optional[int] = int(os.getenv("run_token_budget", 0)) or None,
+                 map_chunk_tokens: int = int(os.getenv("map_chunk_tokens", 4000)),
+                 collapse_tokens: int = int(os.getenv("collapse_token_max", 8000)),
+                 completion_reserve: int = int(os.getenv("completion_token_reserve", 4096))):
+        self.max_tokens = max_tokens
+        self.map_chunk_tokens = map_chunk_tokens
+        self.collapse_tokens = collapse_tokens
+        self.completion_reserve = completion_reserve
+        self.usage: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+        self.callback = TokenUsageCallback(self)
+
+    def record(self, tool: str, prompt_tokens: int, completion_tokens: int):
+        with self._lock:
+            usage = self.usage.setdefault(tool, {"prompt_tokens": 0, "completion_tokens": 0, "calls": 0})
+            usage["prompt_tokens"] += prompt_tokens
+            usage["completion_tokens"] += completion_tokens
+            usage["calls"] += 1
+
+    @property
+    def prompt_tokens(self) -> int:
+        return sum(u["prompt_tokens"] for u in self.usage.values())
+
+    @property
+    def completion_tokens(self) -> int:
+        return sum(u["completion_tokens"] for u in self.usage.values())
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def remaining(self) -> Optional[int]:
+        return None if self.max_tokens is None else max(0, self.max_tokens - self.total_tokens)
+
+    def context_window(self, llm_id: str) -> int:
+        return model_context_windows.get(llm_id, 128000)
+
+    def chunk_size(self, llm_id: str) -> int:
+        """Tokens per map chunk, never more than a quarter of the model's context"""
+        return min(self.map_chunk_tokens, self.context_window(llm_id) // 4)
+
+    def collapse_threshold(self, llm_id: str) -> int:
+        """Summaries above this size are collapsed before the final reduce call"""
+        return min(self.collapse_tokens, self.context_window(llm_id) - self.completion_reserve)
+
+    def affordable_chunks(self, chunk_tokens: int) -> Optional[int]:
+        """How many map calls of chunk_tokens the remaining run budget still covers"""
+        remaining = self.remaining()
+        if remaining is None:
+            return None
+        return remaining // max(1, chunk_tokens + self.completion_reserve // 4)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_tokens": self.max_tokens,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "by_tool": {tool: dict(usage) for tool, usage in self.usage.items()},
+        }
+
+
+class TokenUsageCallback(BaseCallbackHandler):
+    """Feeds every LLM call of a run into its TokenBudget, attributed to the tool that triggered it"""
+
+    run_inline = True
+
+    def __init__(self, budget: TokenBudget):
+        self.budget = budget
+        self._parents: Dict[UUID, Optional[UUID]] = {}
+        self._tools: Dict[UUID, str] = {}
+        self._prompt_estimates: Dict[UUID, int] = {}
+
+    def _tool_for(self, run_id: UUID) -> str:
+        while run_id is not None:
+            if run_id in self._tools:
+                return self._tools[run_id]
+            run_id = self._parents.get(run_id)
+        return "agent"
+
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs):
+        self._parents[run_id] = parent_run_id
+        self._tools[run_id] = (serialized or {}).get("name") or kwargs.get("name") or "tool"
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        self._parents[run_id] = parent_run_id
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs):
+        self._parents[run_id] = parent_run_id
+        self._prompt_estimates[run_id] = sum(len(prompt) // 4 for prompt in prompts)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        self._parents[run_id] = parent_run_id
+        self._prompt_estimates[run_id] = sum(len(self._text_of(m.content)) // 4 for batch in messages for m in batch)
+
+    @staticmethod
+    def _text_of(content) -> str:
+        """Text parts of a message, image payloads are not counted"""
+        if isinstance(content, str):
+            return content
+        return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+
+    def on_llm_end(self, response: LLMResult, *, run_id, **kwargs):
+        prompt_tokens, completion_tokens = self._usage(response)
+        if prompt_tokens is None:
+            # No usage reported (some streaming paths): fall back to estimates
+            prompt_tokens = self._prompt_estimates.get(run_id, 0)
+            completion_tokens = sum(len(g.text) // 4 for batch in response.generations for g in batch)
+        self._prompt_estimates.pop(run_id, None)
+        self.budget.record(self._tool_for(run_id), prompt_tokens, completion_tokens)
+
+    @staticmethod
+    def _usage(response: LLMResult):
+        for batch in response.generations:
+            for generation in batch:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+        token_usage = (response.llm_output or {}).get("token_usage") or (response.llm_output or {}).get("usage")
+        if token_usage:
+            return (token_usage.get("prompt_tokens", token_usage.get("input_tokens", 0)),
+                    token_usage.get("completion_tokens", token_usage.get("output_tokens", 0)))
+        return None, None
@@ -1,80 +1,74 @@
-import os
 import subprocess
-from bson import ObjectId
-from persona.get_persona import persona
 
 from langchain_core.tools import tool
 from langchain.schema import HumanMessage
+from utils.artifacts import ImageArtifact
 from utils.crawl_website import WebCrawler
 from utils.parser import GetLink
 from utils.common_utils import beautify, anthropic_payload_gen_text_only
-from utils.scratchpad_beautifier import ScratchpadBeautify
-from vision.payload_gen import CreateVisionPayload
+from utils.run_context import get_run_context
+from utils.scratchpad_compactor import ScratchpadCompactor
+from utils.scratchpad_store import OBSERVATION_SECTIONS
+from vision.preprocess import VisionPreprocessor
+from vision.tiled_analysis import TiledVisionAnalysis
 
 from prompts.code_generation import code_generation_prompt
-from prompts.prompt_injection import PromptInjection
 
-from handlers.handle_long_context import EnhancedLongContextHandler
 from llms.llm import LLM, azure_supported_models, anthropic_supported_models
-import cv2
-import numpy as np
-from handlers.HeatmapGenerator import HeatmapGenerator
 
-# Initialize tools with persona context
-prompt = PromptInjection(persona(ObjectId(os.getenv("persona"))))
 
-# Beautifier
-beau = ScratchpadBeautify(prompt)
-
-
-#session_manager = SessionManager(mongodb_url=os.getenv("llm_id"), db_name="hedi_db")
-
-# Create new session
-
-# Initialize context handler with session
-lch = EnhancedLongContextHandler(
-    tmp_folder="./tmp",
-    prompt=prompt,
-    beau=beau)
-
-
-# Initialize handlers
-lch = EnhancedLongContextHandler(os.getenv("tmp_folder"), prompt, beau)
+async def read_scratchpad_for_prompt(ctx, sections) -> str:
+    """Scratchpad sections for a prompt of the run's model, older entries summarized past the token threshold"""
+    return await ScratchpadCompactor(ctx.lch.scratchpad, ctx.llm_id).arender(sections=sections, config=ctx.config)
 
 
 @tool
-def crawl(link: str) -> str:
+async def crawl(link: str) -> str:
     """Crawl website and prepare for persona-specific analysis"""
-    llm_id = os.getenv("llm_id")
-    if os.getenv("crawl_mode") != "initial":
-        wc = WebCrawler(llm_id)
-        wc.browse(link)
+    ctx = get_run_context()
+    if ctx.crawl_mode != "initial":
+        wc = WebCrawler(ctx.llm_id, ctx.workspace, ctx.crawl_mode)
+        # Chunks are summarized while the page loads, query_site_textually picks the summaries up
+        ctx.lch.page_url = link
+        stream = ctx.lch.start_stream()
+        try:
+            await wc.abrowse(link, on_section=stream.feed)
+        except Exception:
+            stream.cancel()
+            ctx.lch.stream = None
+            raise
+        stream.finish()
+        ctx.lch.screenshot = wc.screenshot
     else:
-        os.environ["crawl_mode"] = "tool_mode"
-    lch.append_to_agent_scratchpad(f"Analyzing {link} for {prompt.persona['name']}\n", "crawl")
+        ctx.crawl_mode = "tool_mode"
+    ctx.lch.append_to_agent_scratchpad(f"Analyzing {link} for {ctx.persona['name']}\n", "crawl")
     return f"\nCrawling completed\n of {link} \n"
 
 
 @tool
-def query_site_visually(query: str) -> str:
+async def query_site_visually(query: str) -> str:
     """Analyze visual elements from persona perspective"""
     system_instructions = "you are an expert in generating UAT test cases"
-    llm_id = os.getenv("llm_id")
-    cvp = CreateVisionPayload(lch, system_instructions, prompt.visual_prompt, lch.screenshot_path)
-    messages = cvp.get_message()
-    llm = LLM(llm_id).get_llm()
-    result = llm.invoke(messages)
-    lch.append_to_agent_scratchpad(result.content, "query_text_visually")
+    ctx = get_run_context()
+    lch = ctx.lch
+    screenshot = lch.load_screenshot()
+    if screenshot is None:
+        return "Error: Please run crawl first."
+    # Tall pages are sent as viewport-sized tiles sized for the model's image pricing, analyzed concurrently
+    analysis = TiledVisionAnalysis(ctx.llm_id, system_instructions, ctx.prompt.visual_prompt)
+    result = await analysis.run(screenshot)
+    lch.append_to_agent_scratchpad(result, "query_text_visually")
     return f"Visual analysis completed with persona context for query: {query}"
 
 
 @tool
-def query_site_textually(query: str) -> dict:
+async def query_site_textually(query: str) -> str:
     """get command to generate textual information parser
     describe the downloaded and saved html and output should create UAT test cases from the text along with
     website info"""
     try:
-        lch.lg_invoke()
+        # Runs on the agent's event loop, other runs and websocket clients keep being served meanwhile
+        await get_run_context().lch.ainvoke()
         return f"Textual analysis completed successfully with query: {query}"
 
     except Exception as e:
@@ -87,16 +81,25 @@ def query_site_textually(query: str) -> dict:
 @tool
 def analyze_heatmap(query: str) -> str:
     """Generate and analyze heatmap based on persona preferences and previous analyses"""
+    # OpenCV and TensorFlow are only loaded once a heatmap is actually requested
+    import cv2
+    import numpy as np
+    from handlers.HeatmapGenerator import HeatmapGenerator
+
+    ctx = get_run_context()
+    lch = ctx.lch
+    prompt = ctx.prompt
     try:
-        if not os.path.exists(lch.screenshot_path):
+        screenshot = lch.load_screenshot()
+        if screenshot is None:
             return "Error: Please run crawl and visual analysis first."
 
         # Génération de la heatmap
         heatmap_gen = HeatmapGenerator(prompt.persona, lch)
-        heatmap = heatmap_gen.generate(lch.screenshot_path)
+        heatmap = heatmap_gen.generate(screenshot)
 
-        # Lecture de l'image originale
-        original = cv2.imread(lch.screenshot_path)
+        # Image originale, décodée une seule fois
+        original = screenshot.array()
 
         # Redimensionnement de la heatmap à la taille de l'image originale
         heatmap_resized = cv2.resize(heatmap, (original.shape[1], original.shape[0]))
@@ -110,29 +113,22 @@ def analyze_heatmap(query: str) -> str:
 
         # Sauvegarde de la heatmap
         heatmap_path = lch.screenshot_path.replace('.png', '_heatmap.png')
-        cv2.imwrite(heatmap_path, output)
-
-        # Analyse avec le LLM
-        base64_heatmap = lch.encode_image(heatmap_path)
-        llm = LLM(os.getenv("llm_id")).get_llm()
+        heatmap_image = ImageArtifact.from_array(output)
+        heatmap_image.save(heatmap_path)
 
-        analysis_prompt = f"""
-        Analyze this heatmap for {prompt.persona['name']}, focusing on:
-        1. Attention patterns matching their needs: {', '.join(prompt.persona['nmb']['needs'])}
-        2. Mobile usability: {prompt.persona['ux']['navigation']['mobilePriority']}
-        3. Visual hierarchy for their {prompt.persona['ux']['visualStyle']['designStyle']} design preference
-        4. Potential barriers: {', '.join(prompt.persona['nmb']['barriers'])}
+        # Analyse avec le LLM, sans relire l'image sauvegardée
+        heatmap_url = VisionPreprocessor(ctx.llm_id).fit(heatmap_image).data_url()
+        llm = LLM(ctx.llm_id).get_llm()
 
-        Consider previous visual and textual analyses to provide comprehensive insights.
-        """
+        analysis_prompt = prompt.heatmap_prompt
 
         # Préparation des messages selon le type de modèle
-        if os.getenv("llm_id") in azure_supported_models:
+        if ctx.llm_id in azure_supported_models:
             messages = [
                 {"role": "system", "content": "You are a UX analysis expert"},
                 {"role": "user", "content": [
                     {"type": "text", "text": analysis_prompt},
-                    {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{base64_heatmap}"}}
+                    {"type": "image_url", "image_url": {"url": heatmap_url}}
                 ]}
             ]
         else:  # anthropic_supported_models
@@ -140,7 +136,7 @@ def analyze_heatmap(query: str) -> str:
                 HumanMessage(
                     content=[
                         {"type": "text", "text": analysis_prompt},
-                        {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{base64_heatmap}"}}
+                        {"type": "image_url", "image_url": {"url": heatmap_url}}
                     ]
                 )
             ]
@@ -157,75 +153,87 @@ def analyze_heatmap(query: str) -> str:
 
     except Exception as e:
         error_msg = f"Error in heatmap analysis: {str(e)}"
-        lch.append_to_agent_scratchpad(error_msg, "analyze_heatmap")
+        lch.append_to_agent_scratchpad(error_msg, "analyze_heatmap", kind="error")
         return error_msg
 
 
 
 
 @tool
-def generate_python_code(query: str) -> str:
+async def generate_python_code(query: str) -> str:
     """Generate persona-specific test cases"""
-    text = lch.read_from_agent_scratchpad()
-    payload = prompt.code_prompt + code_generation_prompt + text
+    ctx = get_run_context()
+    lch = ctx.lch
+    # Tests are written from what was observed on the site, not from earlier code or test runs
+    text = await read_scratchpad_for_prompt(ctx, OBSERVATION_SECTIONS)
+    payload = ctx.prompt.code_prompt + code_generation_prompt.format(test_log_path=lch.test_log_path) + text
 
-    llm_id = os.getenv("llm_id")
+    llm_id = ctx.llm_id
     llm = LLM(llm_id).get_llm()
 
     if llm_id in azure_supported_models:
-        output = llm.invoke(payload)
+        output = await llm.ainvoke(payload)
     elif llm_id in anthropic_supported_models:
         messages = anthropic_payload_gen_text_only(payload)
-        output = llm.invoke(messages)
+        output = await llm.ainvoke(messages)
 
     processed_code = beautify(output.content)
     final_code = processed_code
-    lch.append_file(lch.python_file_path, final_code)
-    lch.append_to_agent_scratchpad(final_code, "generate_python_code")
+    # Each generation replaces the script, run_python_code runs only the latest tests
+    lch.write_file(lch.python_file_path, final_code)
+    lch.append_to_agent_scratchpad(final_code, "generate_python_code", kind="code")
     return f"Generated persona-specific test code: for the query:  {query}"
 
 
 @tool
 def run_python_code(text: str):
     """Execute tests with persona-specific configurations"""
+    ctx = get_run_context()
+    lch = ctx.lch
     result = subprocess.run(['python', lch.python_file_path], capture_output=True, text=True)
-    test_summary = beau.beautify_python_code_run_results(result)
+    test_summary = ctx.beau.beautify_python_code_run_results(result)
     lch.read_logs_append_to_agent_scratchpad()
     lch.append_to_agent_scratchpad(test_summary, "run_python_code")
     return "Persona-specific tests executed successfully"
 
 
 @tool
-def generate_feedback(query: str)-> str:
+async def generate_feedback(query: str)-> str:
     """ read from the observations and create the feedback template"""
-    scratch_pad = lch.read_from_agent_scratchpad()
-    llm_id = os.getenv("llm_id")
+    ctx = get_run_context()
+    lch = ctx.lch
+    # Observations and test results, the generated code itself is left out
+    scratch_pad = await read_scratchpad_for_prompt(ctx, (*OBSERVATION_SECTIONS, "tests"))
+    llm_id = ctx.llm_id
     llm = LLM(llm_id).get_llm()
     payload = "generate template from the summary based on the defined template structure \n" + scratch_pad
     if llm_id in azure_supported_models:
-        content = llm.invoke(payload).content
+        content = (await llm.ainvoke(payload)).content
     elif llm_id in anthropic_supported_models:
         messages = anthropic_payload_gen_text_only(payload)
-        content = llm.invoke(messages).content
+        content = (await llm.ainvoke(messages)).content
     lch.append_file(lch.feed_back_file_path, content)
     lch.append_file(lch.feed_back_file_path, "-----------------------")
     return f"feedback generated successfully-> for {query}"
 
 @tool
-def check_for_feedback_reliability(query: str) -> str:
+async def check_for_feedback_reliability(query: str) -> str:
     """ check for generated feedback reliability"""
+    ctx = get_run_context()
+    lch = ctx.lch
     llm_id = "sonnet-3-5"
     llm = LLM(llm_id).get_llm()
     feedback = lch.read_file(lch.feed_back_file_path)
-    scratch_pad = lch.read_file(lch.agent_scratchpad_path)
-    answer = llm.invoke(f"check if the feedback: {feedback}  is good enough from the following "
-               f"observations {scratch_pad} do not hallucinate")
+    scratch_pad = await read_scratchpad_for_prompt(ctx, (*OBSERVATION_SECTIONS, "tests"))
+    answer = await llm.ainvoke(f"check if the feedback: {feedback}  is good enough from the following "
+                               f"observations {scratch_pad} do not hallucinate")
     return answer
 
 @tool
 def get_links(text: str) -> str:
     """Analyze links with persona context"""
-    llm = LLM(os.getenv("llm_id")).get_llm()
+    ctx = get_run_context()
+    llm = LLM(ctx.llm_id).get_llm()
     structured_llm = llm.with_structured_output(GetLink)
-    enhanced_text = beau.beautify_extracted_links(text)
+    enhanced_text = ctx.beau.beautify_extracted_links(text)
     return structured_llm.invoke(enhanced_text)
\ No newline at end of file
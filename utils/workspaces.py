@@ -0,0 +1,235 @@
+import asyncio
+import fcntl
+import logging
+import os
+import shutil
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+MB = 1024 * 1024
+# Held with an exclusive flock by the process running the workspace's run
+ACTIVE_MARKER = ".active"
+
+
+def tree_usage(path: str):
+    """Bytes under path and the latest modification time of anything in it"""
+    size, last_modified = 0, 0.0
+    for root, _, files in os.walk(path):
+        try:
+            last_modified = max(last_modified, os.stat(root).st_mtime)
+        except OSError:
+            continue
+        for name in files:
+            try:
+                stat = os.stat(os.path.join(root, name))
+            except OSError:
+                continue
+            size += stat.st_size
+            last_modified = max(last_modified, stat.st_mtime)
+    return size, last_modified
+
+
+@dataclass
+class WorkspaceConfig:
+    """Retention and disk budgets of run workspaces, overridable through the environment"""
+    max_age_s: float = 86400
+    max_total_mb: int = 2048
+    run_quota_mb: int = 256
+    gc_interval_s: float = 600
+
+    @classmethod
+    def from_env(cls) -> "WorkspaceConfig":
+        return cls(
+            max_age_s=float(os.getenv("workspace_max_age_s", cls.max_age_s)),
+            max_total_mb=int(os.getenv("workspace_max_total_mb", cls.max_total_mb)),
+            run_quota_mb=int(os.getenv("workspace_run_quota_mb", cls.run_quota_mb)),
+            gc_interval_s=float(os.getenv("workspace_gc_interval_s", cls.gc_interval_s)),
+        )
+
+
+class WorkspaceManager:
+    """Per-run workspace folders under tmp_folder/runs, collected once the run is over.
+
+    Finished workspaces are removed after max_age_s, and the oldest ones go first whenever all
+    workspaces together exceed max_total_mb. A run holds a flock on the .active marker of its
+    folder, so folders of runs active in any process are never removed. Runs above run_quota_mb
+    are only reported in the metrics, the quota is not enforced.
+    """
+
+    def __init__(self, root: Optional[str] = None, config: Optional[WorkspaceConfig] = None):
+        self._root = root
+        self._config = config
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self.active: Dict[str, str] = {}
+        self._markers: Dict[str, int] = {}
+        self.task: Optional[asyncio.Task] = None
+        # Other disk caches under tmp_folder collected on the same schedule, e.g. the crawl cache
+        self.collectors: List[Callable[[], Any]] = []
+        self.usage_bytes = 0
+        self.runs = 0
+        self.over_quota: List[str] = []
+        self.collected_runs = 0
+        self.collected_bytes = 0
+        self.gc_passes = 0
+        self.last_gc_at: Optional[float] = None
+
+    @property
+    def root(self) -> str:
+        """Read from the environment on first use, the manager is built at import time before .env is loaded"""
+        if self._root is None:
+            tmp_folder = os.getenv("tmp_folder") or os.path.join(os.getcwd(), "tmp_folder")
+            self._root = os.path.join(tmp_folder, "runs")
+        return self._root
+
+    @property
+    def config(self) -> WorkspaceConfig:
+        if self._config is None:
+            self._config = WorkspaceConfig.from_env()
+        return self._config
+
+    def create(self, run_id: str, tmp_folder: Optional[str] = None) -> str:
+        """Workspace folder of a new run, kept until the run is released"""
+        root = os.path.join(tmp_folder, "runs") if tmp_folder else self.root
+        workspace = os.path.join(root, run_id)
+        os.makedirs(workspace, exist_ok=True)
+        marker = os.open(os.path.join(workspace, ACTIVE_MARKER), os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(marker, fcntl.LOCK_EX)
+        with self._lock:
+            self.active[run_id] = workspace
+            self._markers[run_id] = marker
+        return workspace
+
+    def release(self, run_id: str):
+        """The run is over, its workspace may be collected from now on"""
+        with self._lock:
+            workspace = self.active.pop(run_id, None)
+            marker = self._markers.pop(run_id, None)
+        if marker is not None:
+            try:
+                os.remove(os.path.join(workspace, ACTIVE_MARKER))
+            except OSError:
+                pass
+            # Closing the descriptor drops the flock
+            os.close(marker)
+
+    @staticmethod
+    def _in_use(path: str) -> bool:
+        """Whether a run in some process still holds the workspace's marker"""
+        try:
+            marker = os.open(os.path.join(path, ACTIVE_MARKER), os.O_RDONLY)
+        except FileNotFoundError:
+            return False
+        except OSError:
+            return True
+        try:
+            fcntl.flock(marker, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            # Left by a process that ended without releasing its run
+            return False
+        except BlockingIOError:
+            return True
+        finally:
+            os.close(marker)
+
+    def collect(self) -> Dict[str, Any]:
+        """One garbage collection pass: age eviction, then size eviction down to max_total_mb"""
+        now = time.time()
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            names = []
+        with self._lock:
+            active = set(self.active)
+
+        workspaces = []
+        for name in names:
+            path = os.path.join(self.root, name)
+            if os.path.isdir(path):
+                size, last_modified = tree_usage(path)
+                if name not in active and self._in_use(path):
+                    active.add(name)
+                workspaces.append((last_modified, name, path, size))
+        workspaces.sort()
+
+        kept, total, collected, collected_bytes = [], 0, 0, 0
+        for last_modified, name, path, size in workspaces:
+            if name not in active and now - last_modified > self.config.max_age_s:
+                collected += self._remove(path)
+                collected_bytes += size
+            else:
+                kept.append((last_modified, name, path, size))
+                total += size
+
+        # Oldest finished workspaces first until everything fits in the disk budget
+        max_total = self.config.max_total_mb * MB
+        for last_modified, name, path, size in list(kept):
+            if total <= max_total:
+                break
+            if name in active:
+                continue
+            kept.remove((last_modified, name, path, size))
+            collected += self._remove(path)
+            collected_bytes += size
+            total -= size
+
+        quota = self.config.run_quota_mb * MB
+        with self._lock:
+            self.usage_bytes = total
+            self.runs = len(kept)
+            self.over_quota = [name for _, name, _, size in kept if size > quota]
+            self.collected_runs += collected
+            self.collected_bytes += collected_bytes
+            self.gc_passes += 1
+            self.last_gc_at = now
+        if collected:
+            self.logger.info(f"Collected {collected} workspaces ({collected_bytes / MB:.1f} MB), "
+                             f"{len(kept)} left using {total / MB:.1f} MB")
+        if self.over_quota:
+            self.logger.warning(f"Workspaces over the {self.config.run_quota_mb} MB run quota: {self.over_quota}")
+        return self.stats()
+
+    def _remove(self, path: str) -> int:
+        try:
+            shutil.rmtree(path)
+            return 1
+        except OSError as e:
+            self.logger.error(f"Could not remove workspace {path}: {str(e)}")
+            return 0
+
+    async def _collect_periodically(self):
+        while True:
+            for collect in [self.collect, *self.collectors]:
+                try:
+                    await asyncio.to_thread(collect)
+                except Exception as e:
+                    self.logger.error(f"Collection by {getattr(collect, '__qualname__', collect)} failed: {str(e)}")
+            await asyncio.sleep(self.config.gc_interval_s)
+
+    async def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self._collect_periodically())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "runs": self.runs,
+            "active": len(self.active),
+            "usage_mb": round(self.usage_bytes / MB, 1),
+            "max_total_mb": self.config.max_total_mb,
+            "run_quota_mb": self.config.run_quota_mb,
+            "over_quota": list(self.over_quota),
+            "collected_runs": self.collected_runs,
+            "collected_mb": round(self.collected_bytes / MB, 1),
+            "gc_passes": self.gc_passes,
+            "last_gc_at": self.last_gc_at,
+        }
+
+
+workspace_manager = WorkspaceManager()
@@ -1,14 +1,14 @@
-import os
 from utils.const import azure_supported_models, anthropic_supported_models
 from langchain_core.messages import HumanMessage
 
 
 class CreateVisionPayload:
-    def __init__(self, lch, system_instructions, query, image_path):
+    def __init__(self, system_instructions, query, image, llm_id):
         self.system_instructions = system_instructions
         self.query = query
-        self.llm_id = os.getenv("llm_id")
-        self.base64_image = lch.encode_image(image_path)
+        self.llm_id = llm_id
+        # ImageArtifact: the base64 form is encoded once and reused by every payload of the image
+        self.image_url = image.data_url()
         self.message = []
         # self.system_instructions = "you are an expert in generating UAT test cases"
 
@@ -18,7 +18,7 @@ class CreateVisionPayload:
             {"role": "user", "content": [
                 {"type": "text", "text": self.query},
                 {"type": "image_url", "image_url": {
-                    "url": f"data:image/png;base64,{self.base64_image}"}
+                    "url": self.image_url}
                  }
             ]}
         ]
@@ -34,7 +34,7 @@ class CreateVisionPayload:
                         "type": "image_url",
                         "image_url":
                             {
-                                "url": f"data:image/png;base64,{self.base64_image}"
+                                "url": self.image_url
                             },
                     },
                 ],
@@ -0,0 +1,126 @@
+import logging
+import math
+import os
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from utils.artifacts import ImageArtifact
+from utils.const import model_image_pricing
+
+
+def openai_image_size(width: int, height: int) -> Tuple[int, int]:
+    """Size the image is processed at in high detail: fit in 2048x2048, then shortest side at most 768"""
+    scale = min(1.0, 2048 / max(width, height))
+    scale *= min(1.0, 768 / (min(width, height) * scale))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def openai_image_tokens(width: int, height: int) -> int:
+    width, height = openai_image_size(width, height)
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
+
+def anthropic_image_size(width: int, height: int) -> Tuple[int, int]:
+    """Size the image is processed at: long edge at most 1568 and about 1.15 megapixels"""
+    scale = min(1.0, 1568 / max(width, height), math.sqrt(1_150_000 / (width * height)))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def anthropic_image_tokens(width: int, height: int) -> int:
+    width, height = anthropic_image_size(width, height)
+    return math.ceil(width * height / 750)
+
+
+IMAGE_PRICING = {
+    "openai": (openai_image_size, openai_image_tokens),
+    "anthropic": (anthropic_image_size, anthropic_image_tokens),
+}
+
+
+@dataclass
+class ImageTile:
+    image: ImageArtifact
+    index: int
+    count: int
+    top: int
+    bottom: int
+    tokens: int
+
+
+@dataclass
+class VisionConfig:
+    """Tile size and image token budget of a page, overridable through the environment"""
+    tile_height: int = 720
+    max_image_tokens: int = 8000
+    min_width: int = 640
+    max_tiles: int = 8
+
+    @classmethod
+    def from_env(cls) -> "VisionConfig":
+        return cls(
+            tile_height=int(os.getenv("vision_tile_height", cls.tile_height)),
+            max_image_tokens=int(os.getenv("vision_max_image_tokens", cls.max_image_tokens)),
+            min_width=int(os.getenv("vision_min_width", cls.min_width)),
+            max_tiles=int(os.getenv("vision_max_tiles", cls.max_tiles)),
+        )
+
+
+class VisionPreprocessor:
+    """Cuts a full-page screenshot into viewport-sized tiles, at the largest resolution the model's image
+    pricing makes worth sending within the per-page image token budget"""
+
+    def __init__(self, llm_id: str, config: Optional[VisionConfig] = None):
+        config = config or VisionConfig.from_env()
+        self.llm_id = llm_id
+        self.image_size, self.image_tokens = IMAGE_PRICING[model_image_pricing.get(llm_id, "openai")]
+        self.tile_height = config.tile_height
+        self.max_image_tokens = config.max_image_tokens
+        self.min_width = config.min_width
+        self.max_tiles = config.max_tiles
+        self.logger = logging.getLogger(__name__)
+
+    def tile_bounds(self, height: int) -> List[Tuple[int, int]]:
+        """Page rows of each tile, a short tail is folded into the tile above it"""
+        bounds = [(top, min(top + self.tile_height, height)) for top in range(0, height, self.tile_height)]
+        if len(bounds) > 1 and bounds[-1][1] - bounds[-1][0] < self.tile_height // 4:
+            bounds[-2:] = [(bounds[-2][0], bounds[-1][1])]
+        return bounds[:self.max_tiles]
+
+    def plan(self, width: int, height: int) -> Tuple[int, List[Tuple[int, int]]]:
+        """Width to send tiles at and the tiles to send.
+
+        Never wider than the model would process the tile at anyway. Narrower in 64 pixel steps
+        while the tiles cost more than max_image_tokens, down to min_width; past that the lowest
+        tiles are dropped, the top of the page matters most.
+        """
+        bounds = self.tile_bounds(height)
+        tile_width = self.image_size(width, self.tile_height)[0]
+        smallest = min(tile_width, self.min_width)
+        for candidate in range(tile_width, smallest - 1, -64):
+            if self.cost(width, candidate, bounds) <= self.max_image_tokens:
+                return candidate, bounds
+        while len(bounds) > 1 and self.cost(width, smallest, bounds) > self.max_image_tokens:
+            bounds = bounds[:-1]
+        return smallest, bounds
+
+    def cost(self, width: int, scaled_width: int, bounds: List[Tuple[int, int]]) -> int:
+        scale = scaled_width / width
+        return sum(self.image_tokens(scaled_width, max(1, round((bottom - top) * scale))) for top, bottom in bounds)
+
+    def tiles(self, screenshot: ImageArtifact) -> List[ImageTile]:
+        width, height = screenshot.size
+        scaled_width, bounds = self.plan(width, height)
+        scale = scaled_width / width
+        tiles = []
+        for index, (top, bottom) in enumerate(bounds):
+            size = (scaled_width, max(1, round((bottom - top) * scale)))
+            image = screenshot.crop((0, top, width, bottom)).resized(size)
+            tiles.append(ImageTile(image, index, len(bounds), top, bottom, self.image_tokens(*size)))
+        self.logger.info(f"{width}x{height} screenshot sent to {self.llm_id} as {len(tiles)} tiles {scaled_width}px "
+                         f"wide, about {sum(tile.tokens for tile in tiles)} image tokens"
+                         + (f", page cut at {bounds[-1][1]}px" if bounds and bounds[-1][1] < height else ""))
+        return tiles
+
+    def fit(self, image: ImageArtifact) -> ImageArtifact:
+        """Whole image as one input, scaled down to the size the model processes it at"""
+        return image.resized(self.image_size(*image.size))
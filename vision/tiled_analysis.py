@@ -0,0 +1,52 @@
+import asyncio
+import logging
+from typing import List
+
+from llms.llm import LLM, anthropic_supported_models
+from llms.rate_limiter import rate_limiters
+from prompts.vision import merge_template, tile_note
+from utils.artifacts import ImageArtifact
+from utils.common_utils import anthropic_payload_gen_text_only
+from utils.token_counter import count_tokens
+from vision.payload_gen import CreateVisionPayload
+from vision.preprocess import ImageTile, VisionPreprocessor
+
+
+class TiledVisionAnalysis:
+    """Visual analysis of a full page: every tile analyzed concurrently, the analyses merged into one"""
+
+    def __init__(self, llm_id: str, system_instructions: str, query: str):
+        self.llm_id = llm_id
+        self.system_instructions = system_instructions
+        self.query = query
+        self.preprocessor = VisionPreprocessor(llm_id)
+        # SDK retries are off, the rate limiter backs off on 429 instead
+        self.llm = LLM(llm_id, max_retries=0).get_llm()
+        self.limiter = rate_limiters.get(llm_id)
+        self.logger = logging.getLogger(__name__)
+
+    async def analyze_tile(self, tile: ImageTile) -> str:
+        query = self.query
+        if tile.count > 1:
+            query += tile_note.format(index=tile.index + 1, count=tile.count, top=tile.top, bottom=tile.bottom)
+        messages = CreateVisionPayload(self.system_instructions, query, tile.image, self.llm_id).get_message()
+        result = await self.limiter.run(lambda: self.llm.ainvoke(messages),
+                                        tile.tokens + count_tokens(query, self.llm_id))
+        return result.content
+
+    async def merge(self, tiles: List[ImageTile], analyses: List[str]) -> str:
+        payload = merge_template.format(
+            analyses="\n".join(f"Segment {tile.index + 1} (page pixels {tile.top}-{tile.bottom}):\n{analysis}"
+                               for tile, analysis in zip(tiles, analyses)),
+            query=self.query)
+        if self.llm_id in anthropic_supported_models:
+            payload = anthropic_payload_gen_text_only(payload)
+        result = await self.limiter.run(lambda: self.llm.ainvoke(payload), count_tokens(str(payload), self.llm_id))
+        return result.content
+
+    async def run(self, screenshot: ImageArtifact) -> str:
+        tiles = await asyncio.to_thread(self.preprocessor.tiles, screenshot)
+        analyses = await asyncio.gather(*(self.analyze_tile(tile) for tile in tiles))
+        if len(analyses) == 1:
+            return analyses[0]
+        return await self.merge(tiles, list(analyses))